@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import soundfile as sf
+from numpy.lib.stride_tricks import sliding_window_view
+
+from vbap_resample import polyphase_table
+
+# ======================== Loudness analysis ========================
+
+ANALYSIS_CACHE = os.environ.get("VBAP_ANALYSIS_CACHE", os.path.join(os.path.expanduser("~"), ".vbap", "analysis"))
+
+# Playback is normalised to this integrated loudness (LUFS), unless that would
+# push the true peak over TRUE_PEAK_CEILING (dBTP)
+TARGET_LOUDNESS = -18.0
+TRUE_PEAK_CEILING = -1.0
+
+# ITU-R BS.1770 K-weighting at 48 kHz: high shelf, then the RLB high-pass
+K_SHELF = ((1.53512485958697, -2.69169618940638, 1.19839281085285), (1.0, -1.69065929318241, 0.73248077421585))
+K_HIGHPASS = ((1.0, -2.0, 1.0), (1.0, -1.99004745483398, 0.99007225036621))
+
+GATE_SECONDS = 0.4
+GATE_HOP_SECONDS = 0.1
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+
+TRUE_PEAK_OVERSAMPLING = 4
+
+
+def k_weighting_power(samplerate, n):
+    """|H(f)|^2 of the K-weighting filter on the rfft bins of an n-sample frame.
+
+    The filters are specified at 48 kHz; other rates use the same response
+    by frequency, held flat above 24 kHz where the shelf has levelled out.
+    """
+    freqs = np.minimum(np.fft.rfftfreq(n, 1.0 / samplerate), 23900.0)
+    z = np.exp(-2j * np.pi * freqs / 48000.0)
+    response = np.ones_like(z)
+    for b, a in (K_SHELF, K_HIGHPASS):
+        response *= (b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)
+    return np.abs(response) ** 2
+
+
+def _true_peak(padded, table):
+    """Largest |sample| of padded (n, channels) oversampled through a polyphase table.
+
+    Each phase is one 'valid' np.correlate per channel, over n - taps + 1
+    output samples.
+    """
+    peak = 0.0
+    for channel in padded.T:
+        channel = np.ascontiguousarray(channel)
+        for phase in table:
+            out = np.correlate(channel, phase, 'valid')
+            peak = max(peak, float(out.max()), -float(out.min()))
+    return peak
+
+
+def _to_db(power):
+    with np.errstate(divide='ignore'):
+        return 10.0 * np.log10(power)
+
+
+class Analysis:
+    """Level statistics of one file: integrated loudness, peaks and a per-second RMS envelope.
+
+    Levels are in dB (LUFS for loudness, dBTP/dBFS for the peaks); a silent
+    file has loudness -inf. rms_envelope holds one value per second of audio.
+    """
+
+    def __init__(self, loudness, true_peak, sample_peak, rms_envelope, duration, samplerate, channels):
+        self.loudness = loudness
+        self.true_peak = true_peak
+        self.sample_peak = sample_peak
+        self.rms_envelope = np.asarray(rms_envelope, dtype=np.float64)
+        self.duration = duration
+        self.samplerate = samplerate
+        self.channels = channels
+
+    def normalization_gain(self, target=TARGET_LOUDNESS, ceiling=TRUE_PEAK_CEILING):
+        """Linear gain that brings the file to `target` LUFS without its true peak passing `ceiling`."""
+        if not np.isfinite(self.loudness):
+            return 1.0
+        gain_db = min(target - self.loudness, ceiling - self.true_peak)
+        return float(10.0 ** (gain_db / 20.0))
+
+    def to_dict(self):
+        def finite(value):
+            return float(value) if np.isfinite(value) else None
+        return {
+            "loudness": finite(self.loudness),
+            "true_peak": finite(self.true_peak),
+            "sample_peak": finite(self.sample_peak),
+            "rms_envelope": [finite(v) for v in self.rms_envelope],
+            "duration": self.duration,
+            "samplerate": self.samplerate,
+            "channels": self.channels,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        def level(value):
+            return -np.inf if value is None else value
+        return cls(level(data["loudness"]), level(data["true_peak"]), level(data["sample_peak"]),
+                   [level(v) for v in data["rms_envelope"]], data["duration"], data["samplerate"], data["channels"])
+
+
+def analyse_file(path, block_frames=65536):
+    """Measure a file in one streaming pass, a block of `block_frames` at a time.
+
+    Loudness follows ITU-R BS.1770 with equal channel weights. The filter is
+    applied to each 400 ms gating window in the frequency domain: every
+    window of a block goes through one batched rfft. True peak is the
+    largest sample of a 4x polyphase oversampling, one np.correlate per
+    phase and channel. The RMS envelope is
+    averaged over channels in one-second bins.
+    """
+    with sf.SoundFile(path) as f:
+        fs, channels, total = f.samplerate, f.channels, f.frames
+        window = int(round(GATE_SECONDS * fs))
+        hop = int(round(GATE_HOP_SECONDS * fs))
+        weighting = k_weighting_power(fs, window)
+        weighting[1:(window + 1) // 2] *= 2.0   # bins that stand for a negative frequency too
+
+        table = polyphase_table(TRUE_PEAK_OVERSAMPLING, 1, 32).astype(np.float32)
+        taps = table.shape[1]
+
+        carry = np.zeros((0, channels), dtype=np.float32)         # samples not yet in a gating window
+        history = np.zeros((taps - 1, channels), dtype=np.float32)
+        powers, true_peak, sample_peak = [], 0.0, 0.0
+        bin_sums = np.zeros(int(np.ceil(total / fs)) + 1)
+        bin_counts = np.zeros_like(bin_sums)
+        position = 0
+
+        for block in f.blocks(block_frames, dtype='float32', always_2d=True):
+            n = len(block)
+            sample_peak = max(sample_peak, float(np.abs(block).max()))
+
+            # True peak over the oversampled signal, with the previous block's tail as filter history
+            padded = np.concatenate([history, block])
+            true_peak = max(true_peak, _true_peak(padded, table))
+            history = padded[-(taps - 1):]
+
+            # Per-second mean square, averaged over channels
+            seconds = (position + np.arange(n)) // fs
+            first = seconds[0]
+            counts = np.bincount(seconds - first)
+            if first + len(counts) > len(bin_sums):
+                bin_sums = np.pad(bin_sums, (0, first + len(counts) - len(bin_sums)))
+                bin_counts = np.pad(bin_counts, (0, len(bin_sums) - len(bin_counts)))
+            bin_sums[first:first + len(counts)] += np.bincount(seconds - first, weights=np.mean(block ** 2, axis=1))
+            bin_counts[first:first + len(counts)] += counts
+            position += n
+
+            # Every complete 400 ms gating window, stepping 100 ms
+            pending = np.concatenate([carry, block])
+            count = (len(pending) - window) // hop + 1 if len(pending) >= window else 0
+            if count:
+                frames = sliding_window_view(pending, window, axis=0)[:count * hop:hop]   # (count, channels, window)
+                spectra = np.fft.rfft(frames, axis=-1)
+                power = (np.abs(spectra) ** 2 * weighting).sum(axis=-1) / window ** 2
+                powers.append(power.sum(axis=1))
+            carry = pending[count * hop:]
+
+        # Flush the true-peak filter with silence
+        padded = np.concatenate([history, np.zeros((taps // 2, channels), dtype=np.float32)])
+        true_peak = max(true_peak, _true_peak(padded, table))
+
+    powers = np.concatenate(powers) if powers else np.zeros(0)
+    loudness = -np.inf
+    gated = powers[_to_db(powers) - 0.691 > ABSOLUTE_GATE]
+    if len(gated):
+        relative = -0.691 + _to_db(gated.mean()) + RELATIVE_GATE
+        gated = gated[_to_db(gated) - 0.691 > relative]
+        loudness = float(-0.691 + _to_db(gated.mean()))
+
+    used = bin_counts > 0
+    rms = _to_db(bin_sums[used] / bin_counts[used])
+    return Analysis(loudness, float(20.0 * np.log10(true_peak)) if true_peak > 0 else -np.inf,
+                    float(20.0 * np.log10(sample_peak)) if sample_peak > 0 else -np.inf,
+                    rms, total / fs, fs, channels)
+
+
+# ======================== Sidecar cache ========================
+
+def fingerprint(path, chunk=1 << 20):
+    """Content hash of a file: its size plus the first and last MiB, so big files hash quickly."""
+    size = os.path.getsize(path)
+    digest = hashlib.sha1(str(size).encode())
+    with open(path, "rb") as f:
+        digest.update(f.read(chunk))
+        if size > chunk:
+            f.seek(max(size - chunk, chunk))
+            digest.update(f.read(chunk))
+    return digest.hexdigest()
+
+
+def file_analysis(path, cache_dir=ANALYSIS_CACHE, refresh=False):
+    """Analysis of a file, from its sidecar in cache_dir when the hash and mtime still match.
+
+    Otherwise the file is analysed and the sidecar (re)written.
+    """
+    mtime = os.stat(path).st_mtime
+    sidecar = os.path.join(cache_dir, fingerprint(path) + ".json")
+    if not refresh:
+        try:
+            with open(sidecar) as f:
+                record = json.load(f)
+            if record.get("mtime") == mtime:
+                return Analysis.from_dict(record["analysis"])
+        except (OSError, ValueError, KeyError):
+            pass
+
+    analysis = analyse_file(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = f"{sidecar}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"path": os.path.abspath(path), "mtime": mtime, "analysis": analysis.to_dict()}, f)
+    os.replace(tmp, sidecar)
+    return analysis
@@ -0,0 +1,240 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+import soundfile as sf
+
+from vbap_engine import PlaybackEngine
+from vbap_layout import LAYOUTS
+from vbap_offline import render_file
+from vbap_playlist import Track
+from vbap_render import MixSource, SourceMixer
+from vbap_resample import StreamingResampler
+from vbap_trajectory import Trajectory
+
+# ======================== Benchmarks ========================
+#
+# Times the hot paths headless, against plain numpy output buffers, so no
+# audio device is needed:
+#
+#   python vbap_bench.py --output bench.json
+#   python vbap_bench.py --quick --compare bench.json
+#
+# --compare exits non-zero when any case is slower than the baseline by more
+# than --tolerance, so it can gate CI. Every case runs many times and is
+# compared on its fastest run, which scheduler noise can only slow down.
+
+SAMPLERATE = 48000
+BLOCK_SIZES = (32, 64, 128, 256, 512, 1024, 2048, 4096)
+SOURCE_COUNTS = (1, 4, 16, 64)
+
+
+class NoiseReader:
+    """Endless in-memory source with the StreamingSource read() interface."""
+
+    finished = False
+    position = 0
+    frames = 2 ** 40
+
+    def __init__(self, max_frames=max(BLOCK_SIZES), seed=0, samplerate=SAMPLERATE):
+        self.block = np.random.default_rng(seed).uniform(-0.5, 0.5, max_frames).astype(np.float32)
+        self.samplerate = samplerate
+        self.block_start = 0
+
+    def read(self, frames):
+        chunk = self.block[:frames]
+        self.block_start = self.position
+        self.position += len(chunk)
+        return chunk
+
+    def close(self):
+        pass
+
+
+def time_call(fn, repeat, warmup=10):
+    """Run fn repeatedly and return timing statistics in microseconds."""
+    for _ in range(warmup):
+        fn()
+    samples = np.empty(repeat)
+    for i in range(repeat):
+        started = time.perf_counter_ns()
+        fn()
+        samples[i] = time.perf_counter_ns() - started
+    samples /= 1000.0
+    return {
+        "min_us": float(samples.min()),
+        "median_us": float(np.median(samples)),
+        "p99_us": float(np.percentile(samples, 99)),
+        "max_us": float(samples.max()),
+    }
+
+
+def bench_callback(layouts, block_sizes, repeat):
+    results = []
+    for layout in layouts:
+        for channels in (layout.n_speakers, 2) if layout.name == "5.0" else (layout.n_speakers,):
+            engine = PlaybackEngine(layout, channels=channels)
+            try:
+                engine.track = Track(NoiseReader())
+                engine.exchange.publish(track=engine.track, playing=True)
+                for frames in block_sizes:
+                    outdata = np.zeros((frames, channels), dtype=np.float32)
+                    stats = time_call(lambda: engine.audio_callback(outdata, frames, None, None), repeat)
+                    budget_us = frames / SAMPLERATE * 1e6
+                    results.append({"bench": "callback", "layout": layout.name, "channels": channels,
+                                    "frames": frames, "budget_us": budget_us,
+                                    "load": stats["median_us"] / budget_us, **stats})
+            finally:
+                engine.close()
+    return results
+
+
+def bench_mixer(layouts, block_sizes, source_counts, repeat):
+    results = []
+    for layout in layouts:
+        for count in source_counts:
+            mixer = SourceMixer(layout, max_frames=max(block_sizes))
+            for i in range(count):
+                mixer.sources.append(MixSource(NoiseReader(seed=i), azimuth=i * 360.0 / count))
+            mixer.refresh()
+            for frames in block_sizes:
+                outdata = np.zeros((frames, layout.n_speakers), dtype=np.float32)
+                stats = time_call(lambda: mixer.render(outdata), repeat)
+                budget_us = frames / SAMPLERATE * 1e6
+                results.append({"bench": "mixer", "layout": layout.name, "sources": count,
+                                "frames": frames, "budget_us": budget_us,
+                                "load": stats["median_us"] / budget_us, **stats})
+    return results
+
+
+def bench_resampler(block_sizes, repeat):
+    results = []
+    for file_rate in (44100, 96000):
+        resampler = StreamingResampler(NoiseReader(max_frames=4 * max(block_sizes), samplerate=file_rate), SAMPLERATE)
+        for frames in block_sizes:
+            stats = time_call(lambda: resampler.read(frames), repeat)
+            budget_us = frames / SAMPLERATE * 1e6
+            results.append({"bench": "resampler", "rates": f"{file_rate}->{SAMPLERATE}",
+                            "frames": frames, "budget_us": budget_us,
+                            "load": stats["median_us"] / budget_us, **stats})
+    return results
+
+
+def bench_gains(layouts, batch_sizes, repeat):
+    results = []
+    for layout in layouts:
+        stats = time_call(lambda: layout.gain_for(37.0), repeat)
+        results.append({"bench": "gain_for", "layout": layout.name, **stats})
+        for batch in batch_sizes:
+            azimuths = np.random.default_rng(batch).uniform(-180.0, 180.0, batch)
+            stats = time_call(lambda: layout.gains_for(azimuths), max(repeat // 10, 20), warmup=3)
+            results.append({"bench": "gains_for", "layout": layout.name, "batch": batch,
+                            "per_azimuth_us": stats["median_us"] / batch, **stats})
+    return results
+
+
+def bench_offline(layouts, seconds, workdir, repeat):
+    in_path = os.path.join(workdir, "bench_in.wav")
+    noise = np.random.default_rng(0).uniform(-0.5, 0.5, int(seconds * SAMPLERATE)).astype(np.float32)
+    sf.write(in_path, noise, SAMPLERATE, subtype='FLOAT')
+    trajectory = Trajectory([0.0, seconds], [0.0, 720.0])
+
+    results = []
+    for layout in layouts:
+        for moving in (False, True):
+            out_path = os.path.join(workdir, "bench_out.wav")
+            stats = time_call(lambda: render_file(in_path, out_path, azimuth=30.0,
+                                                  trajectory=trajectory if moving else None,
+                                                  layout=layout, subtype='FLOAT'), repeat, warmup=1)
+            elapsed = stats["median_us"] / 1e6
+            results.append({"bench": "offline", "layout": layout.name, "trajectory": moving,
+                            "seconds": seconds, "elapsed_s": elapsed, "realtime_x": seconds / elapsed, **stats})
+    return results
+
+
+CASE_FIELDS = ("bench", "layout", "channels", "sources", "rates", "frames", "batch", "trajectory", "seconds")
+
+
+def case_key(row):
+    return tuple(row.get(field) for field in CASE_FIELDS)
+
+
+def case_name(row):
+    return " ".join(f"{field}={row[field]}" for field in CASE_FIELDS if row.get(field) is not None)
+
+
+def compare(results, baseline_path, tolerance):
+    """Return the cases that got slower than the baseline by more than tolerance.
+
+    Cases are compared on their fastest run (min_us), falling back to the
+    median for baselines written before min_us was recorded.
+    """
+    with open(baseline_path) as f:
+        baseline = {case_key(row): row for row in json.load(f)["results"]}
+    regressions = []
+    for row in results:
+        old = baseline.get(case_key(row))
+        if old is None:
+            continue
+        metric = "min_us" if "min_us" in old else "median_us"
+        if metric not in old:
+            continue
+        if row[metric] > old[metric] * tolerance:
+            regressions.append((row, old[metric], row[metric], metric))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the VBAP render and gain hot paths headless.")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--quick", action="store_true", help="fewer repeats and cases, for CI")
+    parser.add_argument("--compare", help="baseline JSON from a previous --output run")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="allowed slowdown vs baseline (default 1.5)")
+    args = parser.parse_args(argv)
+
+    repeat = 200 if args.quick else 2000
+    layouts = list(LAYOUTS.values())
+    block_sizes = (64, 256, 1024) if args.quick else BLOCK_SIZES
+    source_counts = (1, 16) if args.quick else SOURCE_COUNTS
+
+    results = []
+    results += bench_callback(layouts, block_sizes, repeat)
+    results += bench_mixer(layouts, block_sizes, source_counts, repeat)
+    results += bench_resampler(block_sizes, repeat)
+    results += bench_gains(layouts, (1000, 100000) if args.quick else (100, 1000, 10000, 100000), repeat)
+    with tempfile.TemporaryDirectory() as workdir:
+        results += bench_offline(layouts, 5.0 if args.quick else 30.0, workdir, 3 if args.quick else 5)
+
+    for row in results:
+        print("  ".join(f"{k}={v:.3g}" if isinstance(v, float) else f"{k}={v}" for k, v in row.items()))
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+            "samplerate": SAMPLERATE,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        for row, old, new, metric in regressions:
+            print(f"REGRESSION {case_name(row)}: {metric} {old:.3g} -> {new:.3g}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
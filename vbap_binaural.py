@@ -0,0 +1,163 @@
+import os
+import re
+
+import numpy as np
+import soundfile as sf
+
+from vbap_downmix import speaker_directions
+from vbap_layout import unit_vectors
+
+# ======================== HRIR loading ========================
+
+# "<azimuth>.wav" or "<azimuth>_<elevation>.wav", in degrees, negative azimuths on the left
+HRIR_NAME = re.compile(r"^(-?\d+(?:\.\d+)?)(?:_(-?\d+(?:\.\d+)?))?\.wav$", re.IGNORECASE)
+
+
+def load_hrirs(directory, layout):
+    """Pick the measured HRIR nearest to each speaker of layout from a directory of stereo WAVs.
+
+    Files are named by direction (e.g. "-30.wav", "110_0.wav", "45_45.wav").
+    Returns (hrirs, samplerate) with hrirs shaped (n_speakers, 2, taps),
+    every response zero-padded to the longest one.
+    """
+    measured = []
+    for name in sorted(os.listdir(directory)):
+        match = HRIR_NAME.match(name)
+        if match:
+            measured.append((float(match.group(1)), float(match.group(2) or 0.0), os.path.join(directory, name)))
+    if not measured:
+        raise ValueError(f"No HRIR files named <azimuth>[_<elevation>].wav in {directory}")
+
+    azimuths, elevations = speaker_directions(layout)
+    speakers = unit_vectors(azimuths, elevations)
+    available = unit_vectors(np.array([m[0] for m in measured]), np.array([m[1] for m in measured]))
+    nearest = np.argmax(speakers @ available.T, axis=1)
+
+    responses, samplerate = [], None
+    for index in nearest:
+        data, fs = sf.read(measured[index][2], dtype='float32', always_2d=True)
+        if data.shape[1] != 2:
+            raise ValueError(f"HRIR {measured[index][2]} must have two channels (left, right)")
+        if samplerate not in (None, fs):
+            raise ValueError(f"HRIRs in {directory} mix sample rates {samplerate} and {fs}")
+        samplerate = fs
+        responses.append(data.T)
+
+    hrirs = np.zeros((len(responses), 2, max(r.shape[1] for r in responses)), dtype=np.float32)
+    for i, response in enumerate(responses):
+        hrirs[i, :, :response.shape[1]] = response
+    return hrirs, samplerate
+
+
+# ======================== Partitioned convolution ========================
+
+class PartitionedConvolver:
+    """Uniformly partitioned overlap-save convolution of many inputs into many outputs.
+
+    irs is (inputs, outputs, taps). Each filter is cut into partitions of
+    `partition_frames` whose spectra are computed once, up front. Every
+    partition's worth of input is transformed once and pushed onto a
+    frequency-domain delay line, so one step is `inputs` FFTs, a multiply-
+    accumulate over the delay line and `outputs` inverse FFTs, whatever the
+    filter length. Blocks of any size go through process(); the output lags
+    the input by `latency` frames.
+    """
+
+    def __init__(self, irs, partition_frames=256):
+        irs = np.asarray(irs, dtype=np.float32)
+        self.inputs, self.outputs, taps = irs.shape
+        self.partition_frames = size = partition_frames
+        self.partitions = count = max(-(-taps // size), 1)
+        self.latency = size
+
+        padded = np.zeros((self.inputs, self.outputs, count * size), dtype=np.float32)
+        padded[..., :taps] = irs
+        segments = padded.reshape(self.inputs, self.outputs, count, size).transpose(2, 0, 1, 3)
+        self._spectra = np.fft.rfft(segments, n=2 * size, axis=-1).astype(np.complex64)  # (P, in, out, bins)
+
+        self._fdl = np.zeros((count, self.inputs, size + 1), dtype=np.complex64)
+        self._head = 0
+        self._window = np.zeros((self.inputs, 2 * size), dtype=np.float32)  # previous + current input
+        self._output = np.zeros((size, self.outputs), dtype=np.float32)
+        self._fill = 0
+
+    def reset(self):
+        self._fdl.fill(0)
+        self._window.fill(0)
+        self._output.fill(0)
+        self._fill = 0
+
+    def process(self, block, out):
+        """Convolve block (frames, inputs) into out (frames, outputs)."""
+        size = self.partition_frames
+        done, frames = 0, len(block)
+        while done < frames:
+            take = min(frames - done, size - self._fill)
+            self._window[:, size + self._fill:size + self._fill + take] = block[done:done + take].T
+            out[done:done + take] = self._output[self._fill:self._fill + take]
+            self._fill += take
+            done += take
+            if self._fill == size:
+                self._step()
+                self._fill = 0
+
+    def _step(self):
+        size = self.partition_frames
+        self._head = (self._head - 1) % self.partitions
+        self._fdl[self._head] = np.fft.rfft(self._window, axis=1)
+
+        # Partition p filters the input from p steps ago, i.e. delay line slot head + p
+        split = self.partitions - self._head
+        spectrum = np.einsum('pik,piok->ok', self._fdl[self._head:], self._spectra[:split])
+        if self._head:
+            spectrum += np.einsum('pik,piok->ok', self._fdl[:self._head], self._spectra[split:])
+
+        # Overlap-save: the second half of the circular result is the valid part
+        self._output[:] = np.fft.irfft(spectrum, n=2 * size, axis=1)[:, size:].T
+        self._window[:, :size] = self._window[:, size:]
+
+
+# ======================== Binaural renderer ========================
+
+class BinauralRenderer:
+    """Headphone drop-in for BlockRenderer: virtual speaker feeds through HRIRs.
+
+    Takes per-speaker gains like the loudspeaker path, spreads the source
+    block into one feed per virtual speaker and convolves all of them into
+    the two ear signals in one PartitionedConvolver.
+    """
+
+    channels = 2
+
+    def __init__(self, hrirs, samplerate, partition_frames=256, max_frames=4096):
+        self.samplerate = samplerate
+        self.convolver = PartitionedConvolver(hrirs, partition_frames)
+        self.n_speakers = self.convolver.inputs
+        self._feeds = np.zeros((max_frames, self.n_speakers), dtype=np.float32)
+
+    def _scratch(self, frames):
+        if len(self._feeds) < frames:
+            self._feeds = np.zeros((frames, self.n_speakers), dtype=np.float32)
+        return self._feeds[:frames]
+
+    def render(self, outdata, block, gains, volume):
+        feeds = self._scratch(len(outdata))
+        n = len(block)
+        if block.ndim == 1:
+            np.multiply(block[:, np.newaxis], gains, out=feeds[:n])
+        else:
+            np.matmul(block, gains, out=feeds[:n])
+        feeds[:n] *= volume
+        feeds[n:] = 0
+        self.convolver.process(feeds, outdata)
+
+    def render_automated(self, outdata, block, sample_gains, volume):
+        feeds = self._scratch(len(outdata))
+        n = len(block)
+        if block.ndim == 1:
+            np.multiply(sample_gains[:n], block[:, np.newaxis], out=feeds[:n])
+        else:
+            np.einsum('nc,ncs->ns', block, sample_gains[:n], out=feeds[:n])
+        feeds[:n] *= volume
+        feeds[n:] = 0
+        self.convolver.process(feeds, outdata)
@@ -0,0 +1,310 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+import soundfile as sf
+
+from vbap_source import LANDING_PADS, input_matrix
+
+# ======================== Out-of-process decoding ========================
+
+# Formats decoded in a worker process; anything else streams in-process
+DECODED_EXTENSIONS = (".flac", ".ogg", ".mp3")
+
+# int64 slots at the front of the shared block. The parent writes SEEK_*,
+# HOLD, READ_PAD, APPLIED and STOP; the worker writes FILL_*, STAGED_* and END.
+(SEEK_SERIAL, SEEK_FRAME, FILL_START, FILL_POS, HOLD, END, STOP,
+ STAGED_SERIAL, STAGED_PAD, STAGED_FRAME, STAGED_COUNT, READ_PAD, APPLIED) = range(13)
+HEADER_BYTES = 16 * 8
+
+# Spawned rather than forked: the parent runs Tk, PortAudio and other threads
+_context = multiprocessing.get_context("spawn")
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def wants_decoder(path):
+    return os.path.splitext(path)[1].lower() in DECODED_EXTENSIONS
+
+
+def decoder_pool():
+    """Process pool for whole-file jobs on compressed files, such as the loudness analysis pass."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(mp_context=_context)
+        return _pool
+
+
+def submit(fn, *args):
+    """Run fn(*args) on the decoder pool, starting a new pool if a dead worker broke the old one."""
+    global _pool
+    pool = decoder_pool()
+    try:
+        return pool.submit(fn, *args)
+    except BrokenProcessPool:
+        with _pool_lock:
+            if _pool is pool:
+                _pool = None
+        pool.shutdown(wait=False)
+        return decoder_pool().submit(fn, *args)
+
+
+def _decode(path, name, capacity, prime_frames, input_mode, block_frames, poll):
+    """Worker process: stage each seek in a landing pad and keep the shared ring filled ahead of the reader."""
+    shm = shared_memory.SharedMemory(name=name)
+    header = np.ndarray(HEADER_BYTES // 8, dtype=np.int64, buffer=shm.buf)
+    try:
+        with sf.SoundFile(path) as f:
+            matrix = input_matrix(f.channels, input_mode)
+            ring = np.ndarray((capacity, matrix.shape[1]), dtype=np.float32, buffer=shm.buf, offset=HEADER_BYTES)
+            pads = np.ndarray((LANDING_PADS, prime_frames, matrix.shape[1]), dtype=np.float32,
+                              buffer=shm.buf, offset=HEADER_BYTES + ring.nbytes)
+            block = np.zeros((max(block_frames, prime_frames), f.channels), dtype=np.float32)
+            mixed = np.zeros((block_frames, matrix.shape[1]), dtype=np.float32)
+            staged = (0, 0, 0, 0)
+            ring_serial = 0
+            decoded = 0  # the decoder's own position, so it only seeks when it has to
+            while not header[STOP]:
+                serial = int(header[SEEK_SERIAL])
+                if serial != staged[0]:
+                    # Stage the target in a pad the reader is neither playing nor about to switch to
+                    frame = int(header[SEEK_FRAME])
+                    header[STAGED_SERIAL] = 0
+                    busy = (int(header[READ_PAD]), staged[1])
+                    pad = next(p for p in range(LANDING_PADS) if p not in busy)
+                    if frame != decoded:
+                        f.seek(min(frame, f.frames))
+                    count = f.read(prime_frames, dtype='float32', always_2d=True, out=block[:prime_frames]).shape[0]
+                    decoded = frame + count
+                    np.matmul(block[:count], matrix, out=pads[pad, :count])
+                    if count < prime_frames and frame + count < header[END]:
+                        # The header overestimated the length (MP3): this is the real end
+                        header[END] = frame + count
+                    staged = (serial, pad, frame, count)
+                    header[STAGED_PAD] = pad
+                    header[STAGED_FRAME] = frame
+                    header[STAGED_COUNT] = count
+                    header[STAGED_SERIAL] = serial
+                    continue
+
+                _, _, start, count = staged
+                if header[APPLIED] != staged[0]:
+                    # The reader still plays the ring from before the seek, it has enough buffered
+                    time.sleep(poll)
+                    continue
+                if staged[0] != ring_serial:
+                    # The reader switched to the pad: fill on right after it, unless the ring has that point
+                    ring_serial = staged[0]
+                    fill = int(header[FILL_POS])
+                    if not max(int(header[FILL_START]), fill - capacity) <= start + count <= fill:
+                        # Empty the run first, so [FILL_START, FILL_POS) is valid at every step
+                        header[FILL_POS] = header[FILL_START]
+                        header[FILL_START] = start + count
+                        header[FILL_POS] = start + count
+                    continue
+
+                fill = int(header[FILL_POS])
+                hold = int(header[HOLD])
+                if not header[FILL_START] <= hold <= fill:
+                    # Left over from before a restart: the reader will start at FILL_START
+                    hold = int(header[FILL_START])
+                n = min(block_frames, hold + capacity - fill, int(header[END]) - fill)
+                if n <= 0:
+                    time.sleep(poll)
+                    continue
+                if fill != decoded:
+                    f.seek(min(fill, f.frames))
+                count = f.read(n, dtype='float32', always_2d=True, out=block[:n]).shape[0]
+                decoded = fill + count
+                if count == 0:
+                    header[END] = fill
+                    continue
+                np.matmul(block[:count], matrix, out=mixed[:count])
+                start = fill % capacity
+                head = min(count, capacity - start)
+                ring[start:start + head] = mixed[:head]
+                ring[:count - head] = mixed[head:count]
+                header[FILL_POS] = fill + count
+            del ring, pads
+    finally:
+        del header
+        shm.close()
+
+
+class DecodedSource:
+    """Plays a compressed file (FLAC, Ogg, MP3) decoded by a worker process.
+
+    The worker owns the decoder and writes float32 frames, already through
+    input_matrix(input_mode), into a ring in a multiprocessing.shared_memory
+    block; decoding never holds this process's GIL, and every open file
+    decodes on its own core. The ring is indexed by absolute file frame like
+    StreamingSource's and has the same read/seek/position/finished/ready
+    interface, so it drops in anywhere a StreamingSource does.
+
+    read() returns a view straight into the shared ring whenever the block
+    does not wrap around its end. The worker never writes past
+    HOLD + capacity, and HOLD is the start of the last block returned, so
+    that view stays intact until the next read(). Seeks are staged as in
+    StreamingSource: the worker decodes the first `start_blocks` blocks at
+    the target into a shared landing pad, read() keeps playing the ring
+    until that pad is published and then switches to it, and the ring
+    refills behind the pad.
+    """
+
+    def __init__(self, path, buffer_seconds=10.0, block_frames=4096, start_blocks=4, input_mode="mono"):
+        info = sf.info(path)
+        self.path = path
+        self.samplerate = info.samplerate
+        self.frames = info.frames
+        self.input_mode = input_mode
+        self.channels = input_matrix(info.channels, input_mode).shape[1]
+        self.block_frames = block_frames
+        self.prime_frames = start_blocks * block_frames
+
+        capacity = max(int(buffer_seconds * self.samplerate), (start_blocks + 2) * block_frames)
+        pad_frames = LANDING_PADS * self.prime_frames
+        self._shm = shared_memory.SharedMemory(
+            create=True, size=HEADER_BYTES + (capacity + pad_frames) * self.channels * 4)
+        self._header = np.ndarray(HEADER_BYTES // 8, dtype=np.int64, buffer=self._shm.buf)
+        self._ring = np.ndarray((capacity, self.channels), dtype=np.float32, buffer=self._shm.buf, offset=HEADER_BYTES)
+        self._pads = np.ndarray((LANDING_PADS, self.prime_frames, self.channels), dtype=np.float32,
+                                buffer=self._shm.buf, offset=HEADER_BYTES + self._ring.nbytes)
+        self._header[:] = 0
+        self._header[END] = self.frames
+        self._out = np.zeros((block_frames, self.channels), dtype=np.float32)
+
+        # Consumer-owned: playhead, the seek it follows and the landing pad being played
+        self._play_pos = 0
+        self._applied_seek = 0
+        self._pad = 0
+        self._pad_start = 0
+        self._pad_end = 0
+        self.block_start = 0
+        # Any thread: latest (serial, frame) seek request, mirrored into the header
+        self._seek_request = (0, 0)
+        self.seek(0)
+
+        self._process = _context.Process(
+            target=_decode, name=f"decode {os.path.basename(path)}", daemon=True,
+            args=(path, self._shm.name, capacity, self.prime_frames, input_mode, block_frames,
+                  block_frames / self.samplerate / 4))
+        self._process.start()
+
+    # ---------------------- Control (any thread) ----------------------
+
+    @property
+    def position(self):
+        """Playhead in frames, or the target of a seek that has not landed yet."""
+        serial, frame = self._seek_request
+        return frame if serial != self._applied_seek else self._play_pos
+
+    @property
+    def finished(self):
+        if self._process.exitcode is not None:
+            # The worker died (unreadable file, decoder error): finish with what it decoded
+            play = self._play_pos
+            return not (self._pad_start <= play < self._pad_end
+                        or self._header[FILL_START] <= play < self._header[FILL_POS])
+        return self.position >= min(self.frames, int(self._header[END]))
+
+    @property
+    def ready(self):
+        """True once the latest seek (or the opening one) is staged, so read() returns audio."""
+        return self._header[STAGED_SERIAL] == self._seek_request[0] or self._process.exitcode is not None
+
+    def seek(self, frame):
+        """Queue a seek to an absolute frame; it lands on the first block after staging."""
+        serial, _ = self._seek_request
+        frame = min(max(int(frame), 0), self.frames)
+        self._seek_request = (serial + 1, frame)
+        # Frame before serial, so the worker never pairs the new serial with an old frame
+        self._header[SEEK_FRAME] = frame
+        self._header[SEEK_SERIAL] = serial + 1
+
+    def close(self):
+        self._header[STOP] = 1
+        self._process.join(1.0)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join()
+        self._header = self._ring = self._pads = self._out = None
+        try:
+            self._shm.close()
+        except BufferError:
+            # A caller still holds a view from read(); the mapping goes when that does
+            pass
+        self._shm.unlink()
+
+    # ---------------------- Consumer (audio thread) ----------------------
+
+    def read(self, frames):
+        """Return up to `frames` samples, as a view into the shared ring when they are contiguous.
+
+        Fewer frames than asked means end of file, or the worker falling
+        behind (check `finished` to tell them apart); a pending seek plays
+        on from the old position until its landing pad is staged.
+        `block_start` is set to the file frame of the first returned sample.
+        """
+        header = self._header
+        serial, frame = self._seek_request
+        if serial != self._applied_seek:
+            if header[STAGED_SERIAL] == serial:
+                pad, start, count = int(header[STAGED_PAD]), int(header[STAGED_FRAME]), int(header[STAGED_COUNT])
+                # Only if the worker did not restage while the slots were read
+                if header[STAGED_SERIAL] == serial:
+                    self._pad = pad
+                    header[READ_PAD] = pad
+                    self._pad_start = self._play_pos = start
+                    self._pad_end = start + count
+                    self._applied_seek = serial
+                    header[APPLIED] = serial
+            elif self._process.exitcode is not None:
+                self._pad_start = self._pad_end = self._play_pos = frame
+                self._applied_seek = serial
+
+        play = self._play_pos
+        self.block_start = play
+        if self._pad_start <= play < self._pad_end:
+            if len(self._out) < frames:
+                self._out = np.zeros((frames, self.channels), dtype=np.float32)
+            n = min(frames, self._pad_end - play)
+            offset = play - self._pad_start
+            self._out[:n] = self._pads[self._pad, offset:offset + n]
+            tail = self._ring_run(play + n, frames - n)
+            self._copy_ring(play + n, self._out[n:n + tail])
+            n += tail
+            out = self._out[:n]
+        else:
+            n = self._ring_run(play, frames)
+            capacity = len(self._ring)
+            start = play % capacity
+            if start + n <= capacity:
+                out = self._ring[start:start + n]
+            else:
+                if len(self._out) < n:
+                    self._out = np.zeros((n, self.channels), dtype=np.float32)
+                out = self._out[:n]
+                self._copy_ring(play, out)
+        self._play_pos = play + n
+        return out[:, 0] if self.channels == 1 else out
+
+    def _ring_run(self, play, frames):
+        """How many of `frames` the ring holds from `play` on; holds them against the worker."""
+        header = self._header
+        header[HOLD] = play
+        if not header[FILL_START] <= play:
+            return 0
+        return max(min(frames, int(header[FILL_POS]) - play), 0)
+
+    def _copy_ring(self, play, out):
+        capacity = len(self._ring)
+        start = play % capacity
+        head = min(len(out), capacity - start)
+        out[:head] = self._ring[start:start + head]
+        out[head:] = self._ring[:len(out) - head]
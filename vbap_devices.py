@@ -0,0 +1,178 @@
+import argparse
+import json
+import os
+import time
+
+# ======================== Device capability profiles ========================
+
+PROFILE_PATH = os.environ.get("VBAP_DEVICE_PROFILES", os.path.join(os.path.expanduser("~"), ".vbap", "devices.json"))
+
+PROBE_RATES = (44100, 48000, 88200, 96000, 192000)
+PROBE_BLOCKS = (64, 128, 256, 512, 1024, 2048)
+
+# Stream settings per mode: the smallest safe block at least `min_ms` long,
+# and the latency PortAudio is asked for ("low" and "high" are its defaults)
+LATENCY_MODES = {
+    "low-latency": {"min_ms": 0.0, "latency": "low"},
+    "balanced": {"min_ms": 10.0, "latency": "low"},
+    "power-saver": {"min_ms": 40.0, "latency": "high"},
+}
+
+
+class DeviceProfile:
+    """What one output device can do, as measured once and cached on disk.
+
+    blocks maps a block size (at `probe_rate`) to the output latency
+    PortAudio reported and the underflows seen while running it; a block
+    size is safe when it ran clean.
+    """
+
+    def __init__(self, name, hostapi, max_output_channels, default_samplerate, rates, probe_rate, blocks):
+        self.name = name
+        self.hostapi = hostapi
+        self.max_output_channels = max_output_channels
+        self.default_samplerate = default_samplerate
+        self.rates = list(rates)
+        self.probe_rate = probe_rate
+        self.blocks = {int(size): result for size, result in blocks.items()}
+
+    @property
+    def key(self):
+        return f"{self.hostapi}:{self.name}"
+
+    @property
+    def safe_blocks(self):
+        return sorted(size for size, result in self.blocks.items() if result["underflows"] == 0)
+
+    def stream_settings(self, mode="balanced", samplerate=None):
+        """(blocksize, latency) for an OutputStream at samplerate in one of LATENCY_MODES."""
+        if mode not in LATENCY_MODES:
+            raise ValueError(f"Unknown latency mode {mode!r}, choose from {', '.join(LATENCY_MODES)}")
+        settings = LATENCY_MODES[mode]
+        safe = self.safe_blocks or [max(self.blocks, default=PROBE_BLOCKS[-1])]
+        long_enough = [size for size in safe if size * 1000 / self.probe_rate >= settings["min_ms"]]
+        block = long_enough[0] if long_enough else safe[-1]
+        # Keep the block's duration when the stream runs at another rate than the probe did
+        samplerate = samplerate or self.probe_rate
+        blocksize = max(int(round(block * samplerate / self.probe_rate)), 1)
+        return blocksize, settings["latency"]
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "hostapi": self.hostapi,
+            "max_output_channels": self.max_output_channels,
+            "default_samplerate": self.default_samplerate,
+            "rates": self.rates,
+            "probe_rate": self.probe_rate,
+            "blocks": {str(size): result for size, result in sorted(self.blocks.items())},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["name"], data["hostapi"], data["max_output_channels"], data["default_samplerate"],
+                   data["rates"], data["probe_rate"], data["blocks"])
+
+
+def _device_identity(sd, device):
+    info = sd.query_devices(device, kind='output')
+    hostapi = sd.query_hostapis(info['hostapi'])['name']
+    return info, hostapi
+
+
+def _run_block(sd, device, channels, samplerate, blocksize, seconds):
+    """Play silence at one block size; return (reported latency, underflows)."""
+    underflows = [0]
+
+    def callback(outdata, frames, time_info, status):
+        outdata.fill(0)
+        if status.output_underflow:
+            underflows[0] += 1
+
+    with sd.OutputStream(samplerate=samplerate, blocksize=blocksize, channels=channels, device=device,
+                         latency="low", callback=callback) as stream:
+        time.sleep(seconds)
+        latency = stream.latency
+    return latency, underflows[0]
+
+
+def probe_device(device=None, seconds=0.5, blocks=PROBE_BLOCKS):
+    """Measure an output device: channel count, accepted rates and which block sizes run clean.
+
+    Opens one short silent stream per block size, so it takes about
+    len(blocks) * seconds; the result is meant to be cached with save_profile.
+    """
+    import sounddevice as sd
+    info, hostapi = _device_identity(sd, device)
+    channels = info['max_output_channels']
+    default_rate = int(info['default_samplerate'])
+
+    rates = []
+    for rate in PROBE_RATES:
+        try:
+            sd.check_output_settings(device=device, channels=channels, samplerate=rate)
+            rates.append(rate)
+        except (sd.PortAudioError, ValueError):
+            continue
+
+    results = {}
+    for size in blocks:
+        try:
+            latency, underflows = _run_block(sd, device, channels, default_rate, size, seconds)
+        except (sd.PortAudioError, ValueError):
+            continue
+        results[size] = {"latency": latency, "underflows": underflows}
+    return DeviceProfile(info['name'], hostapi, channels, default_rate, rates or [default_rate], default_rate, results)
+
+
+def load_profiles(path=PROFILE_PATH):
+    """Every cached DeviceProfile by key; empty if the cache does not exist or is unreadable."""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return {key: DeviceProfile.from_dict(entry) for key, entry in data.get("devices", {}).items()}
+
+
+def save_profile(profile, path=PROFILE_PATH):
+    profiles = load_profiles(path)
+    profiles[profile.key] = profile
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"devices": {key: p.to_dict() for key, p in profiles.items()}}, f, indent=2)
+    os.replace(tmp, path)
+
+
+def device_profile(device=None, path=PROFILE_PATH, refresh=False):
+    """The cached profile of an output device, probing and caching it on first use.
+
+    Looking a device up costs one query_devices() call; only a device never
+    seen before (or refresh=True) opens test streams.
+    """
+    import sounddevice as sd
+    info, hostapi = _device_identity(sd, device)
+    profile = None if refresh else load_profiles(path).get(f"{hostapi}:{info['name']}")
+    if profile is None:
+        profile = probe_device(device)
+        save_profile(profile, path)
+    return profile
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Probe an output device and cache its profile.")
+    parser.add_argument("--device", help="output device name or index (default: system default)")
+    parser.add_argument("--refresh", action="store_true", help="probe again even if a profile is cached")
+    args = parser.parse_args()
+
+    device = int(args.device) if args.device and args.device.isdigit() else args.device
+    started = time.perf_counter()
+    profile = device_profile(device, refresh=args.refresh)
+    print(f"{profile.key}: {profile.max_output_channels} channels, rates {profile.rates} "
+          f"({time.perf_counter() - started:.1f} s, cached in {PROFILE_PATH})")
+    for size, result in sorted(profile.blocks.items()):
+        print(f"  block {size:5d}: latency {result['latency'] * 1000:6.1f} ms, {result['underflows']} underflows")
+    for mode in LATENCY_MODES:
+        blocksize, latency = profile.stream_settings(mode)
+        print(f"  {mode:12s} -> blocksize {blocksize}, latency {latency!r}")
@@ -0,0 +1,213 @@
+import numpy as np
+
+# ======================== Distance model ========================
+
+SPEED_OF_SOUND = 343.0  # m/s
+
+# Inverse-distance law: unity gain at and inside REFERENCE_DISTANCE
+REFERENCE_DISTANCE = 1.0
+
+# Air absorption as a one-pole low-pass whose cutoff falls from AIR_CUTOFF_HZ
+# by a factor e every AIR_CUTOFF_METRES, a rough fit to ISO 9613-1 at 20 °C
+AIR_CUTOFF_HZ = 20000.0
+AIR_CUTOFF_METRES = 80.0
+
+# Fastest the delay may change, in samples per sample: a source never
+# approaches or recedes faster than half the speed of sound, so a jump in
+# distance becomes a glide instead of a click (pitch stays within 0.5x-1.5x)
+MAX_DELAY_SLEW = 0.5
+
+
+def distance_gain(distance, reference=REFERENCE_DISTANCE):
+    """Inverse-distance attenuation, 1 inside the reference distance."""
+    return reference / np.maximum(distance, reference)
+
+
+def air_coefficient(distance, samplerate):
+    """One-pole low-pass coefficient for the air absorption over `distance` metres."""
+    cutoff = min(AIR_CUTOFF_HZ * np.exp(-max(distance, 0.0) / AIR_CUTOFF_METRES), 0.45 * samplerate)
+    return 1.0 - np.exp(-2.0 * np.pi * cutoff / samplerate)
+
+
+def one_pole_lowpass(x, coeff, state, scratch):
+    """y[n] = y[n-1] + coeff * (x[n] - y[n-1]) down axis 0 of x (n, C), in place, without a per-sample loop.
+
+    A prefix scan: after the pass with stride k every sample holds its
+    input plus the last 2k - 1 inputs weighted by decay^i, so log2(n)
+    passes of one multiply-add each cover the block, stopping once decay^k
+    falls below 1e-9. All weights stay at or under 1, so float32 is enough.
+    scratch is a float32 array at least x's shape; state (C,) holds the last
+    output of the previous block and is updated in place. Returns x.
+    """
+    n = len(x)
+    if n == 0:
+        return x
+    decay = 1.0 - coeff
+    if decay <= 0.0:
+        state[:] = x[-1]
+        return x
+
+    x *= np.float32(coeff)
+    x[0] += np.float32(decay) * state
+    y, other = x, scratch[:n]
+    stride, weight = 1, decay
+    while stride < n and weight >= 1e-9:
+        other[:stride] = y[:stride]
+        np.multiply(y[:-stride], np.float32(weight), out=other[stride:])
+        other[stride:] += y[stride:]
+        y, other = other, y
+        stride, weight = 2 * stride, weight * weight
+    if y is not x:
+        x[:] = y
+    state[:] = x[-1]
+    return x
+
+
+class DistanceProcessor:
+    """Distance cues for one source: delay (Doppler), inverse-distance gain and air absorption.
+
+    process() writes each block into a delay line and reads it back
+    `distance / SPEED_OF_SOUND` seconds late. The delay is interpolated
+    linearly from the previous block's value to the new one, and the read
+    position of every sample is computed and fractionally interpolated in
+    one vectorised pass, so a moving source gets a smooth Doppler shift.
+    The gain follows the same per-sample distance; the low-pass uses the
+    block's end distance. Delay line, filter state and distance carry over
+    between calls, so the cost per block is fixed whatever the motion.
+    Distances beyond max_distance are clamped until reserve() grows the line.
+    """
+
+    def __init__(self, samplerate, channels=1, max_distance=200.0, max_frames=4096):
+        self.samplerate = samplerate
+        self.channels = channels
+        self.max_delay = max_distance / SPEED_OF_SOUND * samplerate
+        self._reserved = self.max_delay
+        self._pending = None
+        self._state = np.zeros(channels, dtype=np.float32)
+        self._allocate(max_frames)
+        self.reset()
+
+    def _allocate(self, frames):
+        self._ring = np.zeros((int(np.ceil(self.max_delay)) + frames + 2, self.channels), dtype=np.float32)
+        self._steps = np.arange(1, frames + 1, dtype=np.float64)
+        # Per-block scratch, so process() allocates nothing
+        self._delays = np.zeros(frames)
+        self._position = np.zeros(frames)
+        self._floor = np.zeros(frames)
+        self._index = np.zeros(frames, dtype=np.intp)
+        self._next = np.zeros(frames, dtype=np.intp)
+        self._frac = np.zeros(frames, dtype=np.float32)
+        self._gain = np.zeros(frames, dtype=np.float32)
+        self._before = np.zeros((frames, self.channels), dtype=np.float32)
+        self._after = np.zeros((frames, self.channels), dtype=np.float32)
+        self._out = np.zeros((frames, self.channels), dtype=np.float32)
+
+    def reset(self):
+        self._ring.fill(0)
+        self._written = 0
+        self._delay = None
+        self._state.fill(0)
+
+    @property
+    def active(self):
+        """True once a block has gone through since the last reset()."""
+        return self._delay is not None
+
+    @property
+    def distance(self):
+        """Distance in metres the last sample was rendered at (it glides towards the requested one)."""
+        return 0.0 if self._delay is None else self._delay / self.samplerate * SPEED_OF_SOUND
+
+    def reserve(self, max_distance):
+        """Make room for `max_distance` metres; call from any thread but the audio one.
+
+        The larger delay line is allocated here and handed over by reference;
+        the next process() moves the history into it, so nothing is lost and
+        the audio thread never allocates. Never shrinks.
+        """
+        max_delay = max_distance / SPEED_OF_SOUND * self.samplerate
+        if max_delay <= self._reserved:
+            return
+        self._reserved = max_delay
+        ring = np.zeros((int(np.ceil(max_delay)) + len(self._steps) + 2, self.channels), dtype=np.float32)
+        self._pending = (max_delay, ring)
+
+    def _adopt(self, max_delay, ring):
+        """Move the delay line into the larger ring, oldest frame first at its end."""
+        capacity = len(self._ring)
+        start = self._written % capacity
+        tail = ring[len(ring) - capacity:]
+        tail[:capacity - start] = self._ring[start:]
+        tail[capacity - start:] = self._ring[:start]
+        self._ring = ring
+        self._written = len(ring)
+        self.max_delay = max_delay
+
+    def process(self, block, distance, out=None):
+        """Return block (n,) or (n, channels) as heard from `distance` metres.
+
+        The float32 result goes into `out`, shaped like block (it may be
+        block itself), or else into the processor's scratch, where it is
+        only valid until the next call.
+        """
+        n = len(block)
+        if n == 0:
+            return block
+        pending = self._pending
+        if pending is not None and pending[0] > self.max_delay:
+            self._adopt(*pending)
+        if n > len(self._steps):
+            history = self._history(self._written)
+            self._allocate(n)
+            self._ring[-len(history):] = history
+            self._written = len(self._ring)
+
+        # Write the block, then read it back through the delay
+        capacity = len(self._ring)
+        start = self._written % capacity
+        head = min(n, capacity - start)
+        frames = block.reshape(n, self.channels)
+        self._ring[start:start + head] = frames[:head]
+        self._ring[:n - head] = frames[head:]
+
+        target = min(max(distance, 0.0) / SPEED_OF_SOUND * self.samplerate, self.max_delay)
+        previous = target if self._delay is None else self._delay
+        target = previous + np.clip(target - previous, -MAX_DELAY_SLEW * n, MAX_DELAY_SLEW * n)
+        steps = self._steps[:n]
+        delays = np.multiply(steps, (target - previous) / n, out=self._delays[:n])
+        delays += previous
+
+        position = np.subtract(self._written - 1, delays, out=self._position[:n])
+        position += steps
+        index, following = self._index[:n], self._next[:n]
+        floor = np.floor(position, out=self._floor[:n])
+        np.copyto(index, floor, casting='unsafe')
+        np.add(index, 1, out=following)
+        frac, gain = self._frac[:n], self._gain[:n]
+        np.copyto(frac, np.subtract(position, floor, out=floor))
+        # Inverse-distance gain per sample, as distance_gain()
+        np.multiply(delays, SPEED_OF_SOUND / self.samplerate, out=position)
+        np.maximum(position, REFERENCE_DISTANCE, out=position)
+        np.copyto(gain, np.divide(REFERENCE_DISTANCE, position, out=position))
+
+        # Ufuncs that cast or broadcast buffer internally, so scale one channel at a time
+        before = np.take(self._ring, index, axis=0, out=self._before[:n], mode='wrap')
+        after = np.take(self._ring, following, axis=0, out=self._after[:n], mode='wrap')
+        after -= before
+        mixed = self._out[:n]
+        for channel in range(self.channels):
+            after[:, channel] *= frac
+            np.add(before[:, channel], after[:, channel], out=mixed[:, channel])
+            mixed[:, channel] *= gain
+        self._written += n
+        self._delay = target
+
+        one_pole_lowpass(mixed, air_coefficient(self.distance, self.samplerate), self._state, self._before)
+        if out is not None:
+            np.copyto(out.reshape(n, self.channels), mixed)
+            return out
+        return mixed[:, 0] if block.ndim == 1 else mixed
+
+    def _history(self, written):
+        """The ring's contents, oldest frame first."""
+        return np.roll(self._ring, -(written % len(self._ring)), axis=0)
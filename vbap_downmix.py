@@ -0,0 +1,79 @@
+import json
+
+import numpy as np
+
+# ======================== Downmix matrices ========================
+
+# ITU-R BS.775 coefficient for the centre and surrounds in a 5.0 -> 2.0 fold-down (-3 dB)
+ITU_LEVEL = 1 / np.sqrt(2)
+
+
+def speaker_directions(layout):
+    """(azimuths, elevations) in degrees of every speaker, in channel order."""
+    if layout.dimensions == 3:
+        return layout.azimuths_deg, layout.elevations_deg
+    return layout.angles_deg, np.zeros_like(layout.angles_deg)
+
+
+class Downmix:
+    """Maps speaker gains (…, n_inputs) onto output channels (…, n_outputs).
+
+    Coefficients are looked up by speaker direction, never by channel index,
+    so a matrix built for one layout cannot silently pick the wrong speakers
+    of another. Apply it to gain vectors, not to audio: the result is what
+    the render kernel multiplies each block by.
+    """
+
+    def __init__(self, matrix, name=None):
+        self.matrix = np.asarray(matrix, dtype=np.float32)
+        if self.matrix.ndim != 2:
+            raise ValueError("A downmix matrix must be 2D (inputs, outputs)")
+        self.name = name
+        self.n_inputs, self.n_outputs = self.matrix.shape
+
+    @classmethod
+    def itu_stereo(cls, layout, center_level=ITU_LEVEL, surround_level=ITU_LEVEL, center_width_deg=15.0):
+        """ITU-R BS.775 style fold-down of any layout to stereo.
+
+        Speakers within center_width_deg of the front go to both sides at
+        center_level. Ear-level speakers in front of ±80° go to their own
+        side at unity, everything further back or elevated at surround_level.
+        Negative azimuths are on the left.
+        """
+        azimuths, elevations = speaker_directions(layout)
+        azimuths = (np.asarray(azimuths) + 180.0) % 360.0 - 180.0
+        matrix = np.zeros((layout.n_speakers, 2))
+
+        front = (np.abs(azimuths) < 80.0) & (np.abs(elevations) < 10.0)
+        level = np.where(front, 1.0, surround_level)
+        matrix[:, 0] = np.where(azimuths < 0, level, 0.0)
+        matrix[:, 1] = np.where(azimuths > 0, level, 0.0)
+        # Front and back centre speakers feed both sides
+        centre = np.minimum(np.abs(azimuths), 180.0 - np.abs(azimuths)) <= center_width_deg
+        matrix[centre] = (level[centre] * center_level)[:, np.newaxis]
+        return cls(matrix, name=f"{layout.name}->2.0")
+
+    @classmethod
+    def remap(cls, source, target):
+        """Any layout to any layout: pan each source speaker onto the target with VBAP."""
+        azimuths, elevations = speaker_directions(source)
+        if target.dimensions == 3:
+            matrix = target.gains_for(azimuths, elevations)
+        else:
+            matrix = target.gains_for(azimuths)
+        return cls(matrix, name=f"{source.name}->{target.name}")
+
+    @classmethod
+    def identity(cls, n_channels):
+        return cls(np.eye(n_channels), name="identity")
+
+    def apply(self, gains):
+        """Fold speaker gains (n_inputs,) or (N, n_inputs) into output gains."""
+        return np.asarray(gains, dtype=np.float32) @ self.matrix
+
+
+def load_downmix(path):
+    """Read a custom matrix from JSON: {"matrix": [[...], ...]}, one row per input speaker."""
+    with open(path) as f:
+        config = json.load(f)
+    return Downmix(config["matrix"], name=config.get("name", path))
@@ -0,0 +1,634 @@
+from dataclasses import dataclass, replace
+from time import perf_counter
+
+import numpy as np
+
+from vbap_devices import device_profile
+from vbap_downmix import Downmix
+from vbap_events import ANALYSED, FINISHED, OVERFLOW, POSITION, TRACK, UNDERFLOW, EventChannel
+from vbap_layout import SURROUND_5_0
+from vbap_metrics import CallbackMetrics
+from vbap_playlist import Playlist, TransitionBuffers, open_track
+from vbap_render import OUTPUT_FORMATS, BlockRenderer, IntegerOutput
+from vbap_source import spread_gains, spread_offsets
+
+# ======================== Parameter handoff ========================
+
+@dataclass(frozen=True)
+class PlaybackParams:
+    """Immutable snapshot of everything the audio callback needs per block.
+
+    Never mutate the gains array of a published snapshot, publish a new one.
+    The tracks travel with their gains and volumes (the user's volume times
+    the track's normalisation), so the callback never sees one without the
+    other. next_track is the queued next file, played with next_gains and
+    next_volume from the moment it starts until the GUI makes it current;
+    transition holds the scratch the callback renders the two of them with.
+    """
+    gains: np.ndarray
+    volume: float = 1.0
+    playing: bool = False
+    trajectory: object = None
+    distance: float = None
+    track: object = None
+    next_track: object = None
+    next_gains: np.ndarray = None
+    next_volume: float = 1.0
+    transition: object = None
+    serial: int = 0
+
+
+class ParamExchange:
+    """Hands parameter snapshots from the GUI thread to the audio callback.
+
+    The writer builds a new PlaybackParams and swaps the reference, which is
+    atomic under the GIL. The callback reads `current` once at the top of a
+    block, so it always sees a consistent set of gain, volume and transport
+    values and never waits on a lock. Changes land on the next block.
+    Every snapshot gets the next serial number, so the writer can tell
+    when the callback has rendered with one.
+    """
+
+    def __init__(self, gains, volume=1.0, playing=False):
+        self.current = PlaybackParams(np.asarray(gains, dtype=np.float32), volume, playing)
+
+    def publish(self, **changes):
+        if "gains" in changes:
+            changes["gains"] = np.array(changes["gains"], dtype=np.float32)
+        if changes.get("next_gains") is not None:
+            changes["next_gains"] = np.array(changes["next_gains"], dtype=np.float32)
+        self.current = replace(self.current, serial=self.current.serial + 1, **changes)
+
+
+# ======================== Output device ========================
+
+class OutputDevice:
+    """Owns the PortAudio output stream.
+
+    sounddevice is imported on first use, so importing the engine never loads
+    PortAudio or touches the audio hardware.
+
+    With a latency_mode (see vbap_devices.LATENCY_MODES) the stream's block
+    size and latency come from the device's cached profile, probed on the
+    first open if there is none yet. Without one PortAudio picks them.
+
+    dtype is the stream's sample format, one of OUTPUT_FORMATS. "int24" has
+    no numpy type, so it opens a raw stream whose callback gets a bytes buffer.
+    """
+
+    def __init__(self, callback, channels=5, device=None, latency_mode=None, dtype="float32"):
+        self.callback = callback
+        self.channels = channels
+        self.device = device
+        self.latency_mode = latency_mode
+        self.dtype = dtype
+        self.stream = None
+        self._profile = None
+
+    @staticmethod
+    def query(device=None):
+        """Return sounddevice's info dict for an output device (default: the system default)."""
+        import sounddevice as sd
+        return sd.query_devices(device, kind='output')
+
+    def native_rate(self):
+        return int(self.query(self.device)['default_samplerate'])
+
+    def profile(self):
+        """This device's DeviceProfile, from the on-disk cache when it has one."""
+        if self._profile is None:
+            self._profile = device_profile(self.device)
+        return self._profile
+
+    def open(self, samplerate):
+        """Start the stream, keeping the running one if it already has this rate."""
+        if self.stream is not None:
+            if self.stream.samplerate == samplerate:
+                return
+            self.close()
+        blocksize, latency = 0, None
+        if self.latency_mode is not None:
+            blocksize, latency = self.profile().stream_settings(self.latency_mode, samplerate)
+        import sounddevice as sd
+        stream_class = sd.RawOutputStream if self.dtype == "int24" else sd.OutputStream
+        self.stream = stream_class(
+            samplerate=samplerate,
+            blocksize=blocksize,
+            latency=latency,
+            dtype=self.dtype,
+            channels=self.channels,
+            device=self.device,
+            callback=self.callback
+        )
+        self.stream.start()
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream.close()
+            self.stream = None
+
+
+# ======================== Playback engine ========================
+
+# How often, in seconds of playback, the callback reports the playhead
+POSITION_TICK_SECONDS = 0.05
+
+
+class PlaybackEngine:
+    """Single-source VBAP player shared by the Tk front ends.
+
+    Every control method runs on the GUI thread and only publishes a new
+    PlaybackParams snapshot; audio_callback is the only code on the audio
+    thread, and it never publishes. The callback never calls back into the
+    GUI: end of file, playhead ticks, track changes and xruns go into the
+    `events` channel, and the GUI picks them up with poll_events() from its
+    own loop, which is also where on_finished runs. Every block is timed
+    into `metrics`.
+
+    With a Trajectory set, the callback ignores `gains` and evaluates the
+    trajectory at the playhead every block, so the source moves on its own.
+
+    With a distance set, the source goes through a DistanceProcessor first
+    (delay with Doppler, inverse-distance gain, air absorption); its state
+    belongs to the audio thread and carries from block to block.
+
+    When the device has fewer channels than the layout has speakers, the
+    downmix (by default the ITU stereo fold-down) is folded into the gains
+    as they are published, so the callback never sees speaker gains. With a
+    BinauralRenderer the speaker gains go to it unfolded instead, and the
+    output is always two channels.
+
+    The device runs at one rate for the engine's lifetime: `samplerate`, or
+    the device's native rate (the HRIR rate for binaural output). Files at
+    any other rate go through a StreamingResampler.
+
+    latency_mode picks the stream's block size and latency from the device
+    profile: "low-latency", "balanced" or "power-saver" (see vbap_devices).
+
+    Rendering is float32 throughout. With an integer sample_format ("int16",
+    "int24", "int32") blocks are rendered into a float32 scratch and an
+    IntegerOutput dithers, clips and converts them into the device buffer.
+
+    Every file's Analysis (loudness, peaks, RMS envelope), measured once and
+    then cached by vbap_analysis, is looked up in the decoder pool while the
+    file already plays. poll_events() applies it when it arrives and adds an
+    ANALYSED event. With normalize=True the published volume is then the
+    user's volume times the gain that brings the file to TARGET_LOUDNESS,
+    so every file plays at the same level.
+
+    Each file is a Track (vbap_playlist) holding its source, channel offsets,
+    distance state and normalisation. enqueue() queues more files in a
+    Playlist, whose worker opens and pre-buffers the next one; poll_events()
+    hands it to the audio thread once it is ready. The callback starts it at
+    the exact frame the current file ends, or `crossfade` seconds earlier
+    with an equal-power fade, rendering both tracks in one pass for that
+    stretch, then plays on from it alone and queues a TRACK event; the next
+    poll_events() makes it the current track. Nothing on the audio thread
+    opens or reads a file. A queued file that fails to open is skipped, and
+    poll_events() calls on_error(path, message) for it.
+
+    input_mode picks how file channels are used (see vbap_source.input_matrix).
+    In "split" mode every channel is its own source, spread over `width`
+    degrees around the azimuth, and gains become a (C, channels) matrix.
+    """
+
+    def __init__(self, layout=SURROUND_5_0, channels=None, device=None, on_finished=None, downmix=None,
+                 binaural=None, samplerate=None, input_mode="mono", width=60.0, latency_mode=None,
+                 sample_format="float32", normalize=True, crossfade=0.0, on_error=None):
+        self.layout = layout
+        self.normalize = normalize
+        self.input_mode = input_mode
+        self.width = width
+        self.device_rate = samplerate if binaural is None else binaural.samplerate
+        if binaural is not None:
+            if binaural.n_speakers != layout.n_speakers:
+                raise ValueError(f"Binaural renderer has {binaural.n_speakers} virtual speakers, {layout.name} has {layout.n_speakers}")
+            if downmix is not None:
+                raise ValueError("A binaural renderer takes speaker gains, it cannot be combined with a downmix")
+            channels = binaural.channels
+        else:
+            channels = channels or layout.n_speakers
+            if downmix is None and channels != layout.n_speakers:
+                if channels != 2:
+                    raise ValueError(f"No default downmix from {layout.name} to {channels} channels, pass one")
+                downmix = Downmix.itu_stereo(layout)
+            if downmix is not None and (downmix.n_inputs, downmix.n_outputs) != (layout.n_speakers, channels):
+                raise ValueError(f"Downmix {downmix.name!r} does not map {layout.n_speakers} speakers to {channels} channels")
+        self.downmix = downmix
+        self.azimuth = 0.0
+        self.elevation = 0.0
+        self.track = None
+        self._next_track = None
+        # (serial, track) pairs no longer published, closed once the callback rendered past that serial
+        self._retired = []
+        self._waiting = False
+        # Audio thread: the (track, next_track) pair it moved on from, whether it reported the
+        # end, and the serial of the last snapshot it finished a block with
+        self._promoted = (None, None)
+        self._at_end = False
+        self._rendered_serial = 0
+        self.playlist = Playlist(self._open_track)
+        self.crossfade = crossfade
+        self.volume = 1.0
+        self.on_finished = on_finished
+        self.on_error = on_error
+        self.renderer = binaural or BlockRenderer(channels)
+        self.metrics = CallbackMetrics()
+        self.events = EventChannel()
+        self._last_tick = 0.0
+        self.exchange = ParamExchange(self._position_gains())
+        if sample_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown sample format {sample_format!r}, choose from {', '.join(OUTPUT_FORMATS)}")
+        self.output = None if sample_format == "float32" else IntegerOutput(sample_format, channels)
+        self.device = OutputDevice(self.audio_callback, channels, device, latency_mode, sample_format)
+
+    @property
+    def source(self):
+        return None if self.track is None else self.track.source
+
+    @property
+    def analysis(self):
+        return None if self.track is None else self.track.analysis
+
+    @property
+    def normalization(self):
+        return 1.0 if self.track is None else self.track.normalization
+
+    @property
+    def loaded(self):
+        return self.track is not None
+
+    @property
+    def playing(self):
+        return self.exchange.current.playing
+
+    @property
+    def gains(self):
+        return self.exchange.current.gains
+
+    @property
+    def samplerate(self):
+        """Rate the device runs at and the source is read at."""
+        return self.source.samplerate
+
+    @property
+    def block_seconds(self):
+        """Length of the device's latest block, the shortest interval worth publishing gains at."""
+        return self.metrics.block_seconds
+
+    @property
+    def duration(self):
+        """Length of the loaded file in seconds."""
+        return self.source.frames / self.source.samplerate
+
+    @property
+    def position(self):
+        """Playhead in seconds."""
+        return self.source.position / self.source.samplerate
+
+    def load(self, path):
+        """Make `path` the current file; the queue after it is kept (see clear_queue)."""
+        if self.device_rate is None:
+            self.device_rate = self.device.native_rate()
+        self._start_track(self._open_track(path))
+        self.metrics.samplerate = self.device_rate
+        self.device.open(self.device_rate)
+
+    def enqueue(self, *paths):
+        """Queue files to play after the current one, loading the first now if nothing is loaded."""
+        paths = list(paths)
+        if not self.loaded and paths:
+            self.load(paths.pop(0))
+        self.playlist.add(*paths)
+
+    def clear_queue(self):
+        self.playlist.clear()
+        self._adopt_promoted()
+        track, self._next_track = self._next_track, None
+        if track is not None:
+            self._publish_gains()
+            self._retire(track)
+
+    def _open_track(self, path):
+        return open_track(path, self.device_rate, self.input_mode, self.width, self.normalize)
+
+    def _start_track(self, track):
+        previous, self.track = self.track, track
+        self._waiting = False
+        self._publish_gains()
+        if previous is not None:
+            self._retire(previous)
+
+    def play(self, azimuth=None):
+        if azimuth is not None:
+            self.azimuth = azimuth
+        if self.source.finished:
+            self.source.seek(0)
+        self._waiting = False
+        self._publish_gains(playing=True)
+
+    def stop(self):
+        self._waiting = False
+        self.exchange.publish(playing=False)
+
+    def set_azimuth(self, azimuth, elevation=None):
+        """Move the source; elevation is only honoured by 3D layouts."""
+        self.azimuth = azimuth
+        if elevation is not None:
+            self.elevation = elevation
+        self._publish_gains(trajectory=None)
+
+    def set_width(self, width):
+        """Spread of the split input channels around the azimuth, in degrees."""
+        self.width = width
+        for track in (self.track, self._next_track):
+            if track is not None:
+                track.offsets = spread_offsets(track.channels, width)
+        self._publish_gains()
+
+    def set_distance(self, metres):
+        """Place the source `metres` away; None turns the distance model off."""
+        self._publish_gains(distance=metres)
+
+    def set_trajectory(self, trajectory):
+        """Automate the azimuth from the file position; None, or set_azimuth(), stops it."""
+        self.exchange.publish(trajectory=trajectory)
+
+    def _publish_gains(self, **changes):
+        """Publish both tracks with their gains for the current azimuth and their volumes.
+
+        Transition buffers for the pair are allocated here, and kept after
+        the next track is dropped so a fade that already began can finish.
+        """
+        track, upcoming = self.track, self._next_track
+        gains = self._position_gains(track)
+        distance = changes.get("distance", self.exchange.current.distance)
+        if distance is not None:
+            # Grow the delay lines here, the audio thread would clamp the distance
+            for t in (track, upcoming):
+                if t is not None:
+                    t.distance.reserve(distance)
+        transition = self.exchange.current.transition
+        if upcoming is not None and (transition is None or not transition.fits(track.channels, upcoming.channels)):
+            transition = TransitionBuffers(track.channels, upcoming.channels, gains.shape[-1])
+        self.exchange.publish(
+            track=track, gains=gains, volume=self._track_volume(track),
+            next_track=upcoming, next_gains=None if upcoming is None else self._position_gains(upcoming),
+            next_volume=self._track_volume(upcoming), transition=transition, **changes)
+
+    def _track_volume(self, track):
+        return self.volume * (1.0 if track is None else track.normalization)
+
+    def _position_gains(self, track=None):
+        track = track or self.track
+        offsets = spread_offsets(1, self.width) if track is None else track.offsets
+        gains = spread_gains(self._speaker_gains, [self.azimuth], offsets)[0]
+        return gains.reshape(len(offsets), -1) if len(offsets) > 1 else gains
+
+    def _speaker_gains(self, azimuths):
+        """Output channel gains (N, channels) for a batch of azimuths at the current elevation."""
+        if self.layout.dimensions == 3:
+            gains = self.layout.gains_for(azimuths, self.elevation)
+        else:
+            gains = self.layout.gains_for(azimuths)
+        if self.downmix is not None:
+            return self.downmix.apply(gains)
+        return gains.astype(np.float32)
+
+    def set_volume(self, volume):
+        """User volume; the file's loudness normalisation is applied on top."""
+        self.volume = volume
+        self._publish_gains()
+
+    def seek(self, seconds):
+        self.seek_frames(round(seconds * self.source.samplerate))
+
+    def seek_ms(self, milliseconds):
+        self.seek_frames(round(milliseconds * self.source.samplerate / 1000))
+
+    def seek_frames(self, frame):
+        """Sample-accurate seek, staged by the source and applied by the audio thread."""
+        self._adopt_promoted()
+        self.source.seek(frame)
+        track = self._next_track
+        if track is not None and self.track.fade_start is not None:
+            # Leaving a transition: the next file starts over when it comes round again
+            track.source.seek(0)
+
+    def close(self):
+        self.device.close()
+        self.playlist.close()
+        self._close_retired()
+        for track in (self.track, self._next_track):
+            if track is not None:
+                track.close()
+        self.track = self._next_track = None
+
+    def _retire(self, track):
+        """Close `track` once the callback is done with it; call after the publish that drops it."""
+        self._retired.append((self.exchange.current.serial, track))
+
+    def _close_retired(self):
+        # With no stream running nothing can still be reading them
+        rendered = self._rendered_serial if self.device.stream is not None else self.exchange.current.serial
+        done = [track for serial, track in self._retired if serial <= rendered]
+        self._retired = [(serial, track) for serial, track in self._retired if serial > rendered]
+        for track in done:
+            track.close()
+
+    def poll_events(self):
+        """Drain the events the audio thread queued since the last call (GUI thread).
+
+        Returns them as (kind, seconds) tuples. Makes the track the callback
+        moved on to the current one and closes the tracks it moved past,
+        and hands the playlist's next track to the callback once it is
+        buffered. When the current file finished before that, the callback
+        keeps the stream running and starts the next one as soon as it is
+        handed over; only once the queue is empty does playback stop and
+        on_finished run, here, so its handler may touch Tk.
+        """
+        events = self.events.drain()
+        self._adopt_promoted()
+        self._close_retired()
+        while self.playlist.failures:
+            path, message = self.playlist.failures.popleft()
+            if self.on_error is not None:
+                self.on_error(path, message)
+        if self._apply_analyses():
+            events.append((ANALYSED, self.position))
+        if any(kind == FINISHED for kind, _ in events):
+            self._waiting = True
+
+        if self._next_track is None:
+            track = self.playlist.take()
+            if track is not None:
+                self._next_track = track
+                self._publish_gains()
+        if self._next_track is not None:
+            self._waiting = False
+        elif self._waiting and not len(self.playlist):
+            self._waiting = False
+            self.exchange.publish(playing=False)
+            if self.on_finished is not None:
+                self.on_finished()
+        return events
+
+    def _apply_analyses(self):
+        """Take in the analyses that arrived for the current and next track; True if any did."""
+        arrived = False
+        for track in (self.track, self._next_track):
+            if track is None or track.pending is None or not track.pending.done():
+                continue
+            future, track.pending = track.pending, None
+            try:
+                track.set_analysis(future.result())
+            except (OSError, RuntimeError, ValueError) as e:
+                if self.on_error is not None:
+                    self.on_error(track.path, f"analysis failed: {e}")
+                continue
+            arrived = True
+        if arrived:
+            self._publish_gains()
+        return arrived
+
+    def _adopt_promoted(self):
+        """Make the track the callback moved on to the current one; False if it has not (GUI thread)."""
+        previous, promoted = self._promoted
+        if promoted is None or promoted is not self._next_track or previous is not self.track:
+            return False
+        self.track, self._next_track = promoted, None
+        self._publish_gains()
+        self._retire(previous)
+        return True
+
+    def audio_callback(self, outdata, frames, time, status):
+        started = perf_counter()
+        params = self.exchange.current
+        if self.output is None:
+            self._render(outdata, frames, params)
+        else:
+            self._render(self.output.buffer(frames), frames, params)
+            self.output.write(outdata, frames)
+        self._rendered_serial = params.serial
+        self.metrics.record(started, frames, time, status)
+        if status:
+            if status.output_underflow:
+                self.events.push(UNDERFLOW, self._last_tick)
+            if status.output_overflow:
+                self.events.push(OVERFLOW, self._last_tick)
+
+    def _render(self, outdata, frames, params):
+        track, upcoming = params.track, params.next_track
+        gains, volume = params.gains, params.volume
+        previous, promoted = self._promoted
+        if upcoming is not None and upcoming is promoted and track is previous:
+            # Already moved on to the next track, the GUI has not made it current yet
+            track, gains, volume, upcoming = upcoming, params.next_gains, params.next_volume, None
+        if not params.playing or track is None:
+            outdata.fill(0)
+            return
+
+        source = track.source
+        chunk = self._apply_distance(track, source.read(frames), params.distance)
+        fade_start = track.fade_start
+        if fade_start is not None and source.block_start + frames <= fade_start:
+            # Seeked back out of the transition
+            fade_start = track.fade_start = None
+        if fade_start is None and upcoming is not None and upcoming.ready:
+            start = source.frames - int(round(self.crossfade * source.samplerate))
+            if source.block_start + frames > start:
+                fade_start = track.fade_start = max(start, source.block_start)
+                upcoming.distance.reset()
+
+        transition = params.transition
+        if fade_start is not None and transition is not None and transition.channels == track.channels:
+            self._render_transition(outdata, params, track, chunk, upcoming, fade_start)
+        elif params.trajectory is None:
+            self.renderer.render(outdata, chunk, gains, volume)
+        else:
+            sample_gains = self._trajectory_gains(params.trajectory, track, source.block_start, len(chunk))
+            self.renderer.render_automated(outdata, chunk, sample_gains, volume)
+
+        seconds = source.position / source.samplerate
+        if abs(seconds - self._last_tick) >= POSITION_TICK_SECONDS:
+            self._last_tick = seconds
+            self.events.push(POSITION, seconds)
+        if not source.finished:
+            self._at_end = False
+        elif upcoming is not None:
+            # Play on from the next track; the GUI makes it current when it sees TRACK
+            self._promoted = (track, upcoming)
+            self._last_tick = upcoming.source.position / upcoming.source.samplerate
+            self.events.push(TRACK, self._last_tick)
+        elif not self._at_end:
+            self._at_end = True
+            self.events.push(FINISHED, seconds)
+
+    def _apply_distance(self, track, chunk, distance):
+        processor = track.distance
+        if distance is not None:
+            return processor.process(chunk, distance)
+        if processor.active:
+            processor.reset()
+        return chunk
+
+    def _trajectory_gains(self, trajectory, track, start_frame, frames):
+        offsets = track.offsets
+        sample_gains = trajectory.sample_gains(
+            lambda azimuths: spread_gains(self._speaker_gains, azimuths, offsets),
+            start_frame, frames, track.source.samplerate)
+        if len(offsets) == 1:
+            return sample_gains
+        # Explicit output count: an empty block (end of file, underrun) cannot infer it
+        return sample_gains.reshape(frames, len(offsets), sample_gains.shape[-1] // len(offsets))
+
+    def _render_transition(self, outdata, params, track, chunk, upcoming, fade_start):
+        """Render the block where `upcoming` takes over, both tracks as the channels of one block.
+
+        The next track starts at the row of fade_start and both go through
+        an equal-power fade (a cut when there is no crossfade), each at its
+        own volume. Both sets of gains are stacked, so one render call (and,
+        for binaural output, one convolver pass) covers the whole block.
+        Everything is rendered into params.transition; with no upcoming
+        track (the queue was cleared mid-fade) the current one fades out alone.
+        """
+        buffers = params.transition
+        source = track.source
+        frames = len(outdata)
+        lead = fade_start - source.block_start
+        fade_out, fade_in = buffers.weights(frames, lead, source.frames - fade_start, params.volume, params.next_volume)
+        c1, n1 = track.channels, len(chunk)
+        block = buffers.block[:frames]
+        # chunk may be a view into a decoder's ring, so it is never scaled in place
+        np.multiply(chunk.reshape(n1, c1), fade_out[:n1, np.newaxis], out=block[:n1, :c1])
+        block[n1:, :c1] = 0
+        if params.trajectory is not None:
+            current = self._trajectory_gains(params.trajectory, track, source.block_start, frames)
+
+        if upcoming is None:
+            outgoing = block[:, 0] if c1 == 1 else block[:, :c1]
+            if params.trajectory is None:
+                self.renderer.render(outdata, outgoing, params.gains, 1.0)
+            else:
+                self.renderer.render_automated(outdata, outgoing, current, 1.0)
+            return
+
+        first = max(lead, 0)
+        incoming = self._apply_distance(upcoming, upcoming.source.read(frames - first), params.distance)
+        c2, n2 = upcoming.channels, len(incoming)
+        block[:first, c1:] = 0
+        np.multiply(incoming.reshape(n2, c2), fade_in[first:first + n2, np.newaxis], out=block[first:first + n2, c1:])
+        block[first + n2:, c1:] = 0
+
+        if params.trajectory is None:
+            gains = buffers.gains
+            gains[:c1] = params.gains.reshape(c1, -1)
+            gains[c1:] = params.next_gains.reshape(c2, -1)
+            self.renderer.render(outdata, block, gains, 1.0)
+        else:
+            following = self._trajectory_gains(params.trajectory, upcoming, upcoming.source.block_start - first, frames)
+            sample_gains = buffers.sample_gains[:frames]
+            sample_gains[:, :c1] = current.reshape(frames, c1, buffers.outputs)
+            sample_gains[:, c1:] = following.reshape(frames, c2, buffers.outputs)
+            self.renderer.render_automated(outdata, block, sample_gains, 1.0)
@@ -0,0 +1,54 @@
+import numpy as np
+
+# ======================== Audio thread -> GUI events ========================
+
+FINISHED = 1   # the last file ran out and playback stopped
+POSITION = 2   # playhead tick
+UNDERFLOW = 3  # the device ran dry before the callback returned
+OVERFLOW = 4
+TRACK = 5      # the next queued file took over, seconds is its playhead
+ANALYSED = 6   # a file's analysis arrived and its normalisation applies (added by the GUI thread)
+
+EVENT_NAMES = {FINISHED: "finished", POSITION: "position", UNDERFLOW: "underflow", OVERFLOW: "overflow",
+               TRACK: "track", ANALYSED: "analysed"}
+
+
+class EventChannel:
+    """Fixed-size single-producer, single-consumer ring of (kind, seconds) events.
+
+    The audio callback push()es, the GUI drain()s from its `after` loop. The
+    slots are preallocated arrays and each side only writes its own counter
+    (the producer `_written`, the consumer `_read`), so neither side takes a
+    lock or allocates. A slot is filled before `_written` moves past it, so
+    the consumer never sees a half-written event. When the GUI falls behind
+    and the ring is full, new events are dropped and counted in `dropped`
+    rather than overwriting ones not read yet.
+    """
+
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self._kinds = np.zeros(capacity, dtype=np.int8)
+        self._values = np.zeros(capacity, dtype=np.float64)
+        self._written = 0
+        self._read = 0
+        self.dropped = 0
+
+    def push(self, kind, seconds=0.0):
+        """Queue one event; never blocks. Returns False if the ring was full."""
+        written = self._written
+        if written - self._read >= self.capacity:
+            self.dropped += 1
+            return False
+        i = written % self.capacity
+        self._kinds[i] = kind
+        self._values[i] = seconds
+        self._written = written + 1
+        return True
+
+    def drain(self):
+        """Every event queued since the last drain, oldest first, as (kind, seconds) tuples."""
+        read, written = self._read, self._written
+        events = [(int(self._kinds[i % self.capacity]), float(self._values[i % self.capacity]))
+                  for i in range(read, written)]
+        self._read = written
+        return events
@@ -0,0 +1,262 @@
+import json
+from itertools import combinations
+
+import numpy as np
+
+# ======================== Speaker layouts ========================
+
+class SpeakerLayout:
+    """2D VBAP ring of speakers whose pair matrices are inverted once, up front.
+
+    angles_deg gives the azimuth of every speaker in output channel order.
+    Pairs are the neighbours on the ring, so the active pair for an azimuth is
+    found by binary search over the sorted speaker angles, O(log N) per source.
+    """
+
+    dimensions = 2
+
+    def __init__(self, angles_deg, name=None):
+        self.name = name
+        self.angles_deg = np.asarray(angles_deg, dtype=np.float64)
+        self.n_speakers = len(self.angles_deg)
+        if self.n_speakers < 2:
+            raise ValueError("A speaker layout needs at least two speakers")
+
+        # Ring order: channel indices sorted by azimuth in [0, 360)
+        wrapped = np.mod(self.angles_deg, 360.0)
+        order = np.argsort(wrapped, kind="stable")
+        self._ring_deg = wrapped[order]
+        if np.any(np.diff(self._ring_deg) == 0):
+            raise ValueError(f"Duplicate speaker azimuths in layout {name!r}")
+
+        # Pair k spans ring slots k -> k + 1, the last one wraps round to slot 0
+        self.pairs = np.stack([order, np.roll(order, -1)], axis=1)
+        self._span_deg = np.mod(np.roll(self._ring_deg, -1) - self._ring_deg, 360.0)
+        self._span_deg[self._span_deg == 0] = 360.0
+
+        rad = np.radians(self.angles_deg)
+        vectors = np.stack([np.cos(rad), np.sin(rad)], axis=1)
+        bases = np.stack([vectors[self.pairs[:, 0]], vectors[self.pairs[:, 1]]], axis=2)
+
+        # Gaps of 180° or more cannot be panned across, sources there snap to the nearer speaker
+        self._pannable = self._span_deg < 180.0 - 1e-9
+        self.inverses = np.zeros_like(bases)
+        self.inverses[self._pannable] = np.linalg.inv(bases[self._pannable])  # (n_pairs, 2, 2)
+
+    @classmethod
+    def uniform(cls, n_speakers, offset_deg=0.0, name=None):
+        """Evenly spaced ring of n_speakers, channel 0 at offset_deg, going clockwise."""
+        angles = offset_deg + np.arange(n_speakers) * 360.0 / n_speakers
+        return cls((angles + 180.0) % 360.0 - 180.0, name=name or f"{n_speakers}-ring")
+
+    def pair_index(self, angles_deg):
+        """Index into self.pairs of the ring segment containing each azimuth."""
+        wrapped = np.mod(np.asarray(angles_deg, dtype=np.float64).reshape(-1), 360.0)
+        # Slot -1 means "before the first speaker", i.e. the wrap-around pair
+        return (np.searchsorted(self._ring_deg, wrapped, side="right") - 1) % self.n_speakers
+
+    def solve(self, angles_deg):
+        """Return (pair index, unnormalised pair gains) for every azimuth."""
+        angles = np.asarray(angles_deg, dtype=np.float64).reshape(-1)
+        pair_idx = self.pair_index(angles)
+
+        rad = np.radians(angles)
+        sources = np.stack([np.cos(rad), np.sin(rad)], axis=1)
+        pair_gains = (self.inverses[pair_idx] @ sources[:, :, np.newaxis])[:, :, 0]
+
+        snapped = ~self._pannable[pair_idx]
+        if snapped.any():
+            offset = np.mod(angles[snapped] - self._ring_deg[pair_idx[snapped]], 360.0)
+            nearer_second = offset > self._span_deg[pair_idx[snapped]] / 2
+            pair_gains[snapped] = np.stack([~nearer_second, nearer_second], axis=1)
+
+        return pair_idx, np.clip(pair_gains, 0.0, None)
+
+    def gains_for(self, angles_deg):
+        """Vectorised VBAP: azimuths (N,) in degrees -> gains (N, n_speakers)."""
+        pair_idx, selected = self.solve(angles_deg)
+
+        norms = np.linalg.norm(selected, axis=1, keepdims=True)
+        selected = np.divide(selected, norms, out=np.zeros_like(selected), where=norms > 0)
+
+        gains = np.zeros((len(pair_idx), self.n_speakers))
+        rows = np.arange(len(pair_idx))
+        speakers = self.pairs[pair_idx]
+        gains[rows, speakers[:, 0]] = selected[:, 0]
+        gains[rows, speakers[:, 1]] = selected[:, 1]
+        return gains
+
+    def gain_for(self, angle_deg):
+        """Single azimuth -> gains (n_speakers,)."""
+        return self.gains_for([angle_deg])[0]
+
+
+# ======================== 3D layouts ========================
+
+def unit_vectors(azimuths_deg, elevations_deg):
+    az = np.radians(azimuths_deg)
+    el = np.radians(elevations_deg)
+    return np.stack([np.cos(el) * np.cos(az), np.cos(el) * np.sin(az), np.sin(el)], axis=-1)
+
+
+def convex_hull_triplets(points):
+    """Triangulate the convex hull of points on the unit sphere, (n, 3) -> (T, 3) indices.
+
+    Brute force over all triples, which is fine for speaker counts and only
+    runs once per layout. A tiny fixed jitter breaks ties between coplanar
+    speakers (e.g. a square of height speakers) so every face is split once.
+    """
+    jittered = points + np.random.default_rng(0).normal(scale=1e-7, size=points.shape)
+    triples = np.array(list(combinations(range(len(points)), 3)))
+    a, b, c = (jittered[triples[:, k]] for k in range(3))
+    normals = np.cross(b - a, c - a)
+    side = jittered @ normals.T - np.einsum('ij,ij->i', normals, a)  # (n_points, n_triples)
+    side[triples.T, np.arange(len(triples))] = 0.0
+    on_hull = np.all(side <= 0, axis=0) | np.all(side >= 0, axis=0)
+    return triples[on_hull]
+
+
+class SpeakerLayout3D:
+    """3D VBAP over speaker triplets, triangulated and inverted once, up front.
+
+    Imaginary speakers are added at the nadir/zenith when the layout has
+    nothing low/high enough to enclose the listener; their gain is spread
+    over the real speakers they connect to. Triplet lookup goes through a
+    precomputed azimuth/elevation grid listing the few triangles that touch
+    each cell, so a query tests a handful of triplets instead of all of them.
+    """
+
+    dimensions = 3
+
+    def __init__(self, azimuths_deg, elevations_deg, name=None, grid_deg=2.0):
+        self.name = name
+        self.azimuths_deg = np.asarray(azimuths_deg, dtype=np.float64)
+        self.elevations_deg = np.asarray(elevations_deg, dtype=np.float64)
+        self.n_speakers = len(self.azimuths_deg)
+
+        virtual = []
+        if self.elevations_deg.min() > -45:
+            virtual.append((0.0, -90.0))
+        if self.elevations_deg.max() < 60:
+            virtual.append((0.0, 90.0))
+        all_az = np.concatenate([self.azimuths_deg, [v[0] for v in virtual]])
+        all_el = np.concatenate([self.elevations_deg, [v[1] for v in virtual]])
+        vectors = unit_vectors(all_az, all_el)
+
+        triplets = convex_hull_triplets(vectors)
+        bases = vectors[triplets].transpose(0, 2, 1)  # columns are the three speaker vectors
+        usable = np.abs(np.linalg.det(bases)) > 1e-9
+        self.triplets = triplets[usable]
+        self.inverses = np.linalg.inv(bases[usable])  # (n_triplets, 3, 3)
+
+        # (real + imaginary, real) map: identity for real speakers, even spread for imaginary ones
+        self._spread = np.zeros((len(vectors), self.n_speakers))
+        self._spread[:self.n_speakers] = np.eye(self.n_speakers)
+        for v in range(self.n_speakers, len(vectors)):
+            touching = self.triplets[np.any(self.triplets == v, axis=1)]
+            neighbours = np.setdiff1d(touching, np.arange(self.n_speakers, len(vectors)))
+            self._spread[v, neighbours] = 1.0 / len(neighbours)
+
+        self._build_lookup(grid_deg)
+
+    def _contains(self, directions, tolerance):
+        """(P, T) mask of which triplets hold each direction with non-negative gains."""
+        gains = np.einsum('tij,pj->pti', self.inverses, directions)
+        return np.all(gains >= -tolerance, axis=2)
+
+    def _build_lookup(self, grid_deg):
+        self._grid_deg = grid_deg
+        self._n_az = int(np.ceil(360.0 / grid_deg))
+        self._n_el = int(np.ceil(180.0 / grid_deg))
+
+        # Sample every cell at its corners and centre, a cell's candidates are the union
+        az = -180.0 + np.arange(self._n_az + 1) * grid_deg
+        el = np.minimum(-90.0 + np.arange(self._n_el + 1) * grid_deg, 90.0)
+        corners = self._contains(unit_vectors(*np.meshgrid(az, el, indexing='ij')).reshape(-1, 3), 1e-6)
+        corners = corners.reshape(self._n_az + 1, self._n_el + 1, -1)
+        centres = self._contains(unit_vectors(*np.meshgrid(az[:-1] + grid_deg / 2, el[:-1] + grid_deg / 2,
+                                                           indexing='ij')).reshape(-1, 3), 1e-6)
+        touching = (corners[:-1, :-1] | corners[1:, :-1] | corners[:-1, 1:] | corners[1:, 1:]
+                    | centres.reshape(self._n_az, self._n_el, -1))
+
+        # Pad each cell's candidate list with -1 to a fixed width for vectorised lookup
+        width = max(int(touching.sum(axis=2).max()), 1)
+        order = np.argsort(~touching, axis=2, kind="stable")[:, :, :width]
+        self._cells = np.where(np.take_along_axis(touching, order, axis=2), order, -1)
+
+    def triplet_index(self, directions, tolerance=1e-9):
+        """Index into self.triplets of the triangle holding each unit direction (N, 3)."""
+        az = np.degrees(np.arctan2(directions[:, 1], directions[:, 0]))
+        el = np.degrees(np.arcsin(np.clip(directions[:, 2], -1.0, 1.0)))
+        az_cell = np.floor((az + 180.0) / self._grid_deg).astype(np.intp) % self._n_az
+        el_cell = np.clip(np.floor((el + 90.0) / self._grid_deg).astype(np.intp), 0, self._n_el - 1)
+
+        candidates = self._cells[az_cell, el_cell]  # (N, K)
+        gains = (self.inverses[candidates] @ directions[:, np.newaxis, :, np.newaxis])[..., 0]
+        valid = np.all(gains >= -tolerance, axis=2) & (candidates >= 0)
+        found = valid.any(axis=1)
+        index = candidates[np.arange(len(candidates)), np.argmax(valid, axis=1)]
+
+        if not found.all():
+            # Grid miss (a sliver triangle inside one cell): fall back to scanning every triplet
+            missed = directions[~found]
+            gains = np.einsum('tij,nj->nti', self.inverses, missed)
+            index[~found] = np.argmax(gains.min(axis=2), axis=1)
+        return index
+
+    def gains_for(self, azimuths_deg, elevations_deg=0.0):
+        """Vectorised 3D VBAP: directions (N,) in degrees -> gains (N, n_speakers)."""
+        azimuths, elevations = np.broadcast_arrays(np.asarray(azimuths_deg, dtype=np.float64).reshape(-1),
+                                                   np.asarray(elevations_deg, dtype=np.float64).reshape(-1))
+        directions = unit_vectors(azimuths, elevations)
+        index = self.triplet_index(directions)
+
+        selected = np.clip((self.inverses[index] @ directions[:, :, np.newaxis])[:, :, 0], 0.0, None)
+        full = np.zeros((len(index), len(self._spread)))
+        rows = np.arange(len(index))[:, np.newaxis]
+        full[rows, self.triplets[index]] = selected
+
+        gains = full @ self._spread
+        norms = np.linalg.norm(gains, axis=1, keepdims=True)
+        return np.divide(gains, norms, out=np.zeros_like(gains), where=norms > 0)
+
+    def gain_for(self, azimuth_deg, elevation_deg=0.0):
+        """Single direction -> gains (n_speakers,)."""
+        return self.gains_for([azimuth_deg], [elevation_deg])[0]
+
+
+def load_layouts(path):
+    """Read extra layouts from a JSON file mapping names to azimuth lists.
+
+    e.g. {"hexagon": [-30, 30, -90, 90, -150, 150]}, angles in channel order.
+    """
+    with open(path) as f:
+        config = json.load(f)
+    return {name: SpeakerLayout(angles, name=name) for name, angles in config.items()}
+
+
+# Channel order used by audio_callback: FL, FR, C, RL, RR
+SURROUND_5_0 = SpeakerLayout([-30, 30, 0, -110, 110], name="5.0")
+
+# FL, FR, C, SL, SR, BL, BR
+SURROUND_7_0 = SpeakerLayout([-30, 30, 0, -90, 90, -150, 150], name="7.0")
+
+# FL, FR, C, FLw, FRw, SL, SR, BL, BR
+SURROUND_9_0 = SpeakerLayout([-30, 30, 0, -60, 60, -90, 90, -150, 150], name="9.0")
+
+# 5.0 + top middle left/right
+SURROUND_5_0_2 = SpeakerLayout3D(
+    azimuths_deg=[-30, 30, 0, -110, 110, -90, 90],
+    elevations_deg=[0, 0, 0, 0, 0, 45, 45],
+    name="5.0.2",
+)
+
+# 7.0 + top front/back left/right (the LFE of a 7.1.4 feed is not panned)
+SURROUND_7_0_4 = SpeakerLayout3D(
+    azimuths_deg=[-30, 30, 0, -90, 90, -150, 150, -45, 45, -135, 135],
+    elevations_deg=[0, 0, 0, 0, 0, 0, 0, 45, 45, 45, 45],
+    name="7.0.4",
+)
+
+LAYOUTS = {layout.name: layout for layout in (SURROUND_5_0, SURROUND_7_0, SURROUND_9_0,
+                                               SURROUND_5_0_2, SURROUND_7_0_4)}
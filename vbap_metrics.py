@@ -0,0 +1,101 @@
+from time import perf_counter
+
+import numpy as np
+
+# ======================== Callback instrumentation ========================
+
+# Bucket edges for the load histogram, as a fraction of the block budget
+LOAD_BINS = (0.0, 0.1, 0.25, 0.5, 0.75, 1.0, 2.0, np.inf)
+
+
+class CallbackMetrics:
+    """Per-block timing and xrun counters for the audio callback.
+
+    The callback calls record() once per block, which writes into rings
+    preallocated at construction and bumps plain integer counters, so it
+    never grows a buffer or takes a lock. Only the callback writes; readers
+    call snapshot() from any thread and at worst see one slot mid-update.
+    """
+
+    def __init__(self, capacity=4096, samplerate=48000):
+        self.capacity = capacity
+        self.samplerate = samplerate
+        self._elapsed = np.zeros(capacity)
+        self._budget = np.zeros(capacity)
+        self._dac_time = np.full(capacity, np.nan)
+        self.blocks = 0
+        self.underflows = 0
+        self.overflows = 0
+
+    def record(self, started, frames, time, status):
+        """Log one block. started is perf_counter() taken on callback entry."""
+        i = self.blocks % self.capacity
+        self._elapsed[i] = perf_counter() - started
+        self._budget[i] = frames / self.samplerate
+        self._dac_time[i] = time.outputBufferDacTime if time is not None else np.nan
+        if status:
+            if status.output_underflow:
+                self.underflows += 1
+            if status.output_overflow:
+                self.overflows += 1
+        self.blocks += 1
+
+    @property
+    def block_seconds(self):
+        """Length of the most recent block in seconds, 0 before the first one."""
+        blocks = self.blocks
+        return float(self._budget[(blocks - 1) % self.capacity]) if blocks else 0.0
+
+    def _window(self, ring, blocks):
+        """Copy of the filled part of a ring, oldest block first."""
+        if blocks <= self.capacity:
+            return ring[:blocks].copy()
+        return np.roll(ring, -(blocks % self.capacity))
+
+    def snapshot(self):
+        """Summary of the last `capacity` blocks plus the lifetime counters."""
+        blocks = self.blocks
+        elapsed = self._window(self._elapsed, blocks)
+        budget = self._window(self._budget, blocks)
+        dac_time = self._window(self._dac_time, blocks)
+        n = len(elapsed)
+
+        summary = {
+            "blocks": blocks,
+            "underflows": self.underflows,
+            "overflows": self.overflows,
+            "window": n,
+        }
+        if n == 0:
+            return summary
+
+        load = elapsed / np.where(budget > 0, budget, np.inf)
+        summary.update({
+            "late_blocks": int(np.count_nonzero(load > 1.0)),
+            "elapsed_p99_us": float(np.percentile(elapsed, 99) * 1e6),
+            "load_mean": float(load.mean()),
+            "load_p99": float(np.percentile(load, 99)),
+            "load_max": float(load.max()),
+            "load_histogram": np.histogram(load, bins=LOAD_BINS)[0].tolist(),
+        })
+
+        # DAC jitter: how far each block's DAC timestamp strays from the previous one plus its length
+        jitter = np.diff(dac_time) - budget[:-1]
+        jitter = jitter[np.isfinite(jitter)]
+        if len(jitter):
+            summary["dac_jitter_rms_us"] = float(np.sqrt(np.mean(jitter ** 2)) * 1e6)
+            summary["dac_jitter_max_us"] = float(np.abs(jitter).max() * 1e6)
+        return summary
+
+
+def format_metrics(summary):
+    """Multi-line text rendering of a snapshot(), for logs and the GUI panel."""
+    lines = [f"blocks {summary['blocks']}  underflows {summary['underflows']}  overflows {summary['overflows']}"]
+    if summary["window"]:
+        lines.append(f"load mean {summary['load_mean']:.1%}  p99 {summary['load_p99']:.1%}  "
+                     f"max {summary['load_max']:.1%}  late {summary['late_blocks']}")
+        edges = [f"<{edge:.0%}" for edge in LOAD_BINS[1:-1]] + [f">{LOAD_BINS[-2]:.0%}"]
+        lines.append("  ".join(f"{edge} {count}" for edge, count in zip(edges, summary["load_histogram"])))
+    if "dac_jitter_rms_us" in summary:
+        lines.append(f"DAC jitter rms {summary['dac_jitter_rms_us']:.0f} us  max {summary['dac_jitter_max_us']:.0f} us")
+    return "\n".join(lines)
@@ -0,0 +1,267 @@
+import argparse
+import time
+
+import numpy as np
+import soundfile as sf
+
+from vbap_binaural import BinauralRenderer, load_hrirs
+from vbap_distance import SPEED_OF_SOUND, DistanceProcessor
+from vbap_downmix import Downmix, load_downmix
+from vbap_layout import LAYOUTS, SURROUND_5_0, load_layouts
+from vbap_render import BlockRenderer, MixSource, SourceMixer
+from vbap_source import INPUT_MODES, input_matrix, spread_gains, spread_offsets
+from vbap_trajectory import Trajectory, load_trajectory
+
+# ======================== Offline renderer ========================
+#
+# Renders a file to a multichannel WAV without Tk or an audio device:
+#
+#   python vbap_offline.py input.wav output.wav --azimuth 45
+#   python vbap_offline.py input.wav output.wav --trajectory path.csv --layout 2.0
+#   python vbap_offline.py input.wav output.wav --rotate 90
+#   python vbap_offline.py input.wav output.wav --layouts-file rings.json --layout octagon
+#   python vbap_offline.py input.wav output.wav --layout 7.0.4 --downmix 5.0
+#   python vbap_offline.py input.wav output.wav --binaural hrirs/
+#   python vbap_offline.py input.wav output.wav --azimuth -30 --mix other.wav 30
+#
+# A trajectory CSV holds "time_seconds,azimuth_deg[,gain]" keyframes, one per line.
+# "2.0" is the ITU stereo fold-down of the 5.0 render. --downmix takes "itu",
+# a layout name to remap onto, or a JSON file holding a custom matrix.
+# Each --mix adds another file at its own azimuth, mixed in by a SourceMixer.
+
+STEREO = "2.0"
+
+
+def output_gains(azimuths, layout, gain, elevation=0.0, downmix=None):
+    """Per-azimuth channel gains (N, channels) for a speaker layout or STEREO, after any downmix."""
+    if layout == STEREO:
+        layout, downmix = SURROUND_5_0, downmix or Downmix.itu_stereo(SURROUND_5_0)
+    if layout.dimensions == 3:
+        gains = layout.gains_for(azimuths, elevation).astype(np.float32)
+    else:
+        gains = layout.gains_for(azimuths).astype(np.float32)
+    gains *= gain
+    if downmix is not None:
+        gains = downmix.apply(gains)
+    return gains
+
+
+def render_file(in_path, out_path, azimuth=0.0, trajectory=None, layout=SURROUND_5_0,
+                gain=1.0, block_frames=65536, subtype=None, elevation=0.0, downmix=None, binaural=None,
+                input_mode="mono", width=60.0, distance=None):
+    """Spatialise in_path into out_path, one large block at a time.
+
+    The input channels are combined as the live engine does (see
+    vbap_source.input_matrix); in "split" mode each one is placed
+    separately, spread over `width` degrees around the azimuth. With a
+    Trajectory the gains follow it sample by sample, exactly as the live
+    engine plays it; otherwise the fixed azimuth is used for the whole file.
+    elevation only applies to 3D layouts; downmix, if given, maps the
+    layout's speakers onto the output channels. With a BinauralRenderer the
+    speaker feeds are convolved to two ear signals instead. A distance in
+    metres applies the live engine's distance model. The binaural latency
+    and the distance delay are trimmed off. Returns (frames, samplerate).
+    """
+    with sf.SoundFile(in_path) as infile:
+        fs = infile.samplerate
+        if binaural is not None and binaural.samplerate != fs:
+            raise ValueError(f"{in_path} is at {fs} Hz but the HRIRs are at {binaural.samplerate} Hz")
+        matrix = input_matrix(infile.channels, input_mode)
+        offsets = spread_offsets(matrix.shape[1], width)
+
+        def gains_for(azimuths):
+            return spread_gains(lambda directions: output_gains(directions, layout, gain, elevation, downmix),
+                                azimuths, offsets)
+
+        fixed_gains = gains_for([azimuth])[0].reshape(len(offsets), -1)
+        renderer = binaural or BlockRenderer(fixed_gains.shape[1])
+        if len(offsets) == 1:
+            fixed_gains = fixed_gains[0]
+        processor = None
+        delay = 0
+        if distance is not None:
+            processor = DistanceProcessor(fs, len(offsets), max_distance=distance + 1.0, max_frames=block_frames)
+            delay = int(round(distance / SPEED_OF_SOUND * fs))
+
+        with sf.SoundFile(out_path, 'w', fs, renderer.channels, subtype=subtype) as outfile:
+            position = 0
+            skip = delay + (0 if binaural is None else binaural.convolver.latency)
+
+            def render(source):
+                nonlocal position, skip
+                if processor is not None:
+                    source = processor.process(source, distance)
+                rendered = np.empty((len(source), renderer.channels), dtype=np.float32)
+                if trajectory is None:
+                    renderer.render(rendered, source, fixed_gains, 1.0)
+                else:
+                    gains = trajectory.sample_gains(gains_for, position, len(source), fs)
+                    if source.ndim == 2:
+                        gains = gains.reshape(len(source), len(offsets), -1)
+                    renderer.render_automated(rendered, source, gains, 1.0)
+                outfile.write(rendered[skip:])
+                skip = max(skip - len(source), 0)
+                position += len(source)
+
+            for block in infile.blocks(block_frames, dtype='float32', always_2d=True):
+                source = block @ matrix
+                render(source[:, 0] if len(offsets) == 1 else source)
+            frames = position
+
+            if delay:
+                # Push silence through the delay line so the end of the file comes out
+                render(np.zeros((delay,) + fixed_gains.shape[:-1], dtype=np.float32))
+            if binaural is not None:
+                # Flush the convolver so the output lines up with, and is as long as, the input
+                tail = np.empty((binaural.convolver.latency, 2), dtype=np.float32)
+                binaural.render(tail, np.zeros((0,) + fixed_gains.shape[:-1], dtype=np.float32), fixed_gains, 1.0)
+                outfile.write(tail[skip:])
+
+    return frames, fs
+
+
+class FileReader:
+    """Blocking reader for a SourceMixer: a file's frames through input_matrix, nothing after the end."""
+
+    def __init__(self, path, input_mode="mono"):
+        self.file = sf.SoundFile(path)
+        self.samplerate = self.file.samplerate
+        self.frames = self.file.frames
+        self.matrix = input_matrix(self.file.channels, input_mode)
+        self.channels = self.matrix.shape[1]
+
+    def read(self, frames):
+        block = self.file.read(frames, dtype='float32', always_2d=True) @ self.matrix
+        return block[:, 0] if self.channels == 1 else block
+
+    def close(self):
+        self.file.close()
+
+
+def render_mix(inputs, out_path, layout=SURROUND_5_0, gain=1.0, block_frames=65536, subtype=None,
+               elevation=0.0, downmix=None, input_mode="mono", width=60.0, distance=None):
+    """Mix several files, each at its own azimuth, into out_path through a SourceMixer.
+
+    inputs holds (path, azimuth) pairs. Each file's channels are combined
+    as in render_file, so in "split" mode every channel is placed
+    separately around the file's azimuth. All files must have one sample
+    rate, and the mix lasts as long as the longest. gain, elevation,
+    downmix and distance apply to every source. Returns (frames, samplerate).
+    """
+    if layout == STEREO:
+        layout, downmix = SURROUND_5_0, downmix or Downmix.itu_stereo(SURROUND_5_0)
+    readers = []
+    try:
+        for path, _ in inputs:
+            readers.append(FileReader(path, input_mode))
+        fs = readers[0].samplerate
+        for (path, _), reader in zip(inputs, readers):
+            if reader.samplerate != fs:
+                raise ValueError(f"{path} is at {reader.samplerate} Hz, {inputs[0][0]} at {fs} Hz")
+
+        mixer = SourceMixer(layout, downmix, max_frames=block_frames, samplerate=fs)
+        for (_, azimuth), reader in zip(inputs, readers):
+            mixer.sources.append(MixSource(reader, azimuth, gain, elevation, distance, width))
+        mixer.refresh()
+        channels = layout.n_speakers if downmix is None else downmix.n_outputs
+        frames = max(reader.frames for reader in readers)
+        delay = 0 if distance is None else int(round(distance / SPEED_OF_SOUND * fs))
+
+        rendered = np.empty((block_frames, channels), dtype=np.float32)
+        with sf.SoundFile(out_path, 'w', fs, channels, subtype=subtype) as outfile:
+            # Run on past the end by the distance delay, and trim that much off the front
+            skip, remaining = delay, frames + delay
+            while remaining > 0:
+                n = min(block_frames, remaining)
+                mixer.render(rendered[:n])
+                outfile.write(rendered[skip:n])
+                skip = max(skip - n, 0)
+                remaining -= n
+    finally:
+        for reader in readers:
+            reader.close()
+    return frames, fs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render a sound file through VBAP without an audio device.")
+    parser.add_argument("input", help="input sound file")
+    parser.add_argument("output", help="output sound file")
+    position = parser.add_mutually_exclusive_group()
+    position.add_argument("--azimuth", type=float, default=0.0, help="fixed source azimuth in degrees (default 0)")
+    position.add_argument("--trajectory", help="CSV of time_seconds,azimuth_deg[,gain] keyframes")
+    position.add_argument("--rotate", type=float, metavar="DEG_PER_S", help="rotate the source at constant speed, starting at 0°")
+    parser.add_argument("--elevation", type=float, default=0.0, help="source elevation in degrees for 3D layouts (default 0)")
+    parser.add_argument("--layout", default="5.0", help=f"output layout: {STEREO}, {', '.join(LAYOUTS)} or one from --layouts-file (default 5.0)")
+    parser.add_argument("--layouts-file", help="JSON file mapping extra layout names to speaker azimuths")
+    parser.add_argument("--downmix", help="fold the layout down: itu (stereo), a target layout name, or a JSON matrix file")
+    parser.add_argument("--binaural", metavar="HRIR_DIR", help="render for headphones through the HRIRs in this directory")
+    parser.add_argument("--input-mode", choices=INPUT_MODES, default="mono",
+                        help="mono: energy-preserving downmix, first: channel 0 only, split: every channel placed separately (default mono)")
+    parser.add_argument("--width", type=float, default=60.0, help="spread of split channels around the azimuth in degrees (default 60)")
+    parser.add_argument("--distance", type=float, metavar="METRES", help="source distance: delay, inverse-distance gain and air absorption")
+    parser.add_argument("--mix", nargs=2, action="append", metavar=("FILE", "DEG"), default=[],
+                        help="mix another file in at this azimuth; repeat for more sources")
+    parser.add_argument("--gain", type=float, default=1.0, help="linear output gain (default 1.0)")
+    parser.add_argument("--block-size", type=int, default=65536, help="frames per render block (default 65536)")
+    parser.add_argument("--subtype", help="soundfile subtype of the output, e.g. PCM_24 or FLOAT")
+    args = parser.parse_args(argv)
+
+    layouts = dict(LAYOUTS)
+    if args.layouts_file:
+        layouts.update(load_layouts(args.layouts_file))
+    if args.layout != STEREO and args.layout not in layouts:
+        parser.error(f"unknown layout {args.layout!r}, choose from {STEREO}, {', '.join(layouts)}")
+    layout = layouts.get(args.layout, STEREO)
+
+    downmix = None
+    if args.downmix:
+        speakers = SURROUND_5_0 if layout == STEREO else layout
+        if args.downmix == "itu":
+            downmix = Downmix.itu_stereo(speakers)
+        elif args.downmix in layouts:
+            downmix = Downmix.remap(speakers, layouts[args.downmix])
+        else:
+            downmix = load_downmix(args.downmix)
+        if downmix.n_inputs != speakers.n_speakers:
+            parser.error(f"downmix {downmix.name!r} takes {downmix.n_inputs} speakers, {args.layout} has {speakers.n_speakers}")
+
+    binaural = None
+    if args.binaural:
+        if layout == STEREO or downmix is not None:
+            parser.error("--binaural renders the layout's own speakers, it cannot be combined with 2.0 or --downmix")
+        hrirs, hrir_rate = load_hrirs(args.binaural, layout)
+        binaural = BinauralRenderer(hrirs, hrir_rate, max_frames=args.block_size)
+
+    mix = []
+    for path, azimuth in args.mix:
+        try:
+            mix.append((path, float(azimuth)))
+        except ValueError:
+            parser.error(f"--mix {path} {azimuth}: the azimuth must be a number of degrees")
+    if mix and (args.trajectory or args.rotate is not None or binaural is not None):
+        parser.error("--mix places every source at a fixed azimuth, it cannot be combined with --trajectory, --rotate or --binaural")
+
+    trajectory = None
+    if args.trajectory:
+        trajectory = load_trajectory(args.trajectory)
+    elif args.rotate is not None:
+        trajectory = Trajectory.rotation(args.rotate)
+
+    started = time.perf_counter()
+    if mix:
+        frames, fs = render_mix([(args.input, args.azimuth)] + mix, args.output, layout, args.gain,
+                                args.block_size, args.subtype, args.elevation, downmix,
+                                args.input_mode, args.width, args.distance)
+    else:
+        frames, fs = render_file(args.input, args.output, args.azimuth, trajectory, layout,
+                                 args.gain, args.block_size, args.subtype, args.elevation, downmix, binaural,
+                                 args.input_mode, args.width, args.distance)
+    elapsed = time.perf_counter() - started
+
+    speed = (frames / fs) / elapsed if elapsed > 0 else float("inf")
+    print(f"Rendered {frames / fs:.1f} s to {args.output} ({args.layout}) in {elapsed:.2f} s, {speed:.0f}x real time")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import threading
+from collections import deque
+
+import numpy as np
+
+from vbap_analysis import file_analysis
+from vbap_decoder import DecodedSource, submit, wants_decoder
+from vbap_distance import DistanceProcessor
+from vbap_resample import StreamingResampler
+from vbap_source import StreamingSource, spread_offsets
+
+# ======================== Tracks ========================
+
+class Track:
+    """One loaded file and everything the engine keeps per file.
+
+    Holds the source (already at the device rate), the azimuth offsets of
+    its channels, its DistanceProcessor and its loudness normalisation, so
+    the audio thread can swap all of them at once by swapping the Track.
+    While `pending` holds the Future of its analysis the normalisation is 1.0.
+    """
+
+    def __init__(self, source, path=None, width=60.0, analysis=None, normalize=True, pending=None):
+        self.source = source
+        self.path = path
+        self.channels = getattr(source, "channels", 1)
+        self.offsets = spread_offsets(self.channels, width)
+        self.distance = DistanceProcessor(source.samplerate, self.channels)
+        self.normalize = normalize
+        self.analysis = None
+        self.normalization = 1.0
+        self.pending = pending
+        if analysis is not None:
+            self.set_analysis(analysis)
+        # Audio thread: source frame where the transition into the next track began
+        self.fade_start = None
+
+    def set_analysis(self, analysis):
+        self.analysis = analysis
+        self.normalization = analysis.normalization_gain() if self.normalize else 1.0
+
+    @property
+    def ready(self):
+        """True once the source has its first blocks buffered and read() will not return silence."""
+        return getattr(self.source, "ready", True)
+
+    def close(self):
+        if self.pending is not None:
+            self.pending.cancel()
+        self.source.close()
+
+
+def open_track(path, samplerate, input_mode="mono", width=60.0, normalize=True):
+    """Open a file as a Track at `samplerate`, resampling if the file has another rate.
+
+    Compressed formats (see vbap_decoder.DECODED_EXTENSIONS) are decoded in
+    a worker process. The analysis pass of every file runs in the decoder
+    pool and is left in Track.pending, so opening never waits for it.
+    """
+    if wants_decoder(path):
+        source = DecodedSource(path, input_mode=input_mode)
+    else:
+        source = StreamingSource(path, input_mode=input_mode)
+    try:
+        if source.samplerate != samplerate:
+            source = StreamingResampler(source, samplerate)
+        pending = submit(file_analysis, path)
+    except Exception:
+        # Stop the reader and free its buffers; nothing else holds them yet
+        source.close()
+        raise
+    return Track(source, path, width, normalize=normalize, pending=pending)
+
+
+# ======================== Playlist ========================
+
+class Playlist:
+    """Files still to play, with the next one opened and pre-buffered in the background.
+
+    A worker thread takes the first path, opens it with open_track (file
+    header, resampler, analysis job) and waits for its first blocks to
+    be staged, then leaves it in `ready`. Whoever plays it take()s it,
+    which wakes the worker to prepare the one after. Nothing here ever
+    runs on the audio thread. Files that fail to open are skipped and
+    queued in `failures` as (path, message) for the GUI thread to report.
+    """
+
+    def __init__(self, open_track):
+        self.open_track = open_track
+        self.paths = deque()
+        self.ready = None
+        self.loading = None
+        self.failures = deque()
+        self._generation = 0
+        # Guards paths, ready and the generation against clear() racing the worker
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._preload, name="preload", daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        return len(self.paths) + (self.loading is not None) + (self.ready is not None)
+
+    def add(self, *paths):
+        self.paths.extend(paths)
+        self._wake.set()
+
+    def take(self):
+        """The pre-buffered next Track, or None if it is not ready yet."""
+        with self._lock:
+            track, self.ready = self.ready, None
+        if track is not None:
+            self._wake.set()
+        return track
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self.paths.clear()
+            track, self.ready = self.ready, None
+        if track is not None:
+            track.close()
+
+    def close(self):
+        self.clear()
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+
+    def _preload(self):
+        while not self._stop.is_set():
+            if self.ready is not None or not self.paths:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+
+            with self._lock:
+                if not self.paths:
+                    continue
+                generation = self._generation
+                path = self.loading = self.paths.popleft()
+            try:
+                track = self.open_track(path)
+            except (OSError, RuntimeError, ValueError) as e:
+                self.failures.append((path, str(e)))
+                self.loading = None
+                continue
+            while not track.ready and not self._stop.is_set():
+                self._stop.wait(0.005)
+            with self._lock:
+                if generation == self._generation and not self._stop.is_set():
+                    self.ready, track = track, None
+                self.loading = None
+            if track is not None:
+                # Cleared while this one was opening
+                track.close()
+
+
+# ======================== Transitions ========================
+
+class TransitionBuffers:
+    """Scratch for rendering two tracks as the channels of one block.
+
+    Allocated on the GUI thread when the next track is handed over, for
+    that pair of channel counts and `outputs` gain columns, so the callback
+    renders a transition without allocating. Only the audio thread writes
+    into it; a block longer than max_frames grows it there.
+    """
+
+    def __init__(self, channels, next_channels, outputs, max_frames=4096):
+        self.channels = channels
+        self.next_channels = next_channels
+        self.outputs = outputs
+        self._allocate(max_frames)
+
+    def _allocate(self, frames):
+        width = self.channels + self.next_channels
+        self.block = np.zeros((frames, width), dtype=np.float32)
+        self.gains = np.zeros((width, self.outputs), dtype=np.float32)
+        self.sample_gains = np.zeros((frames, width, self.outputs), dtype=np.float32)
+        self.rows = np.arange(frames, dtype=np.float32)
+        self.fade_out = np.zeros(frames, dtype=np.float32)
+        self.fade_in = np.zeros(frames, dtype=np.float32)
+
+    def fits(self, channels, next_channels):
+        return (self.channels, self.next_channels) == (channels, next_channels)
+
+    def weights(self, frames, lead, fade_frames, volume=1.0, next_volume=1.0):
+        """Equal-power (outgoing, incoming) weights for one block of a transition, times each volume.
+
+        The fade starts `lead` rows into the block (negative once it began in an
+        earlier block) and lasts fade_frames; with fade_frames == 0 it is a hard
+        cut at that row, the gapless case.
+        """
+        if frames > len(self.rows):
+            self._allocate(frames)
+        fade_out, fade_in = self.fade_out[:frames], self.fade_in[:frames]
+        progress = np.subtract(self.rows[:frames], np.float32(lead), out=fade_out)
+        if fade_frames > 0:
+            progress /= np.float32(fade_frames)
+        else:
+            progress += 1
+        np.clip(progress, 0.0, 1.0, out=progress)
+        progress *= np.float32(np.pi / 2)
+        np.sin(progress, out=fade_in)
+        np.cos(progress, out=fade_out)
+        fade_out *= np.float32(volume)
+        fade_in *= np.float32(next_volume)
+        return fade_out, fade_in
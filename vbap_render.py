@@ -0,0 +1,256 @@
+import sys
+from dataclasses import dataclass
+
+import numpy as np
+
+from vbap_distance import DistanceProcessor
+from vbap_downmix import Downmix
+from vbap_source import spread_offsets
+
+# ======================== Render kernel ========================
+
+class BlockRenderer:
+    """Renders a source block into the output buffer without allocating.
+
+    The gains it is given are already per output channel (any downmix is
+    folded in when they are published), so a mono block is one broadcast
+    outer product with the volume and a multichannel block (n, C) is one
+    matmul with a (C, channels) gain matrix. Everything stays in float32.
+    """
+
+    def __init__(self, channels=5):
+        self.channels = channels
+        self._gains = np.zeros((1, channels), dtype=np.float32)
+
+    def _scaled(self, gains, volume):
+        if self._gains.shape[0] < gains.size // self.channels:
+            self._gains = np.zeros((gains.size // self.channels, self.channels), dtype=np.float32)
+        return np.multiply(gains, volume, out=self._gains[:gains.size // self.channels].reshape(gains.shape))
+
+    def render(self, outdata, block, gains, volume):
+        """Write block * gains * volume into outdata (frames, channels).
+
+        block is (n,) with gains (channels,), or (n, C) with gains (C, channels).
+        Rows past n are zeroed, which covers the end of the file.
+        """
+        n = len(block)
+        gains = self._scaled(gains, volume)
+        if block.ndim == 1:
+            np.multiply(block[:, np.newaxis], gains, out=outdata[:n])
+        else:
+            np.matmul(block, gains, out=outdata[:n])
+        outdata[n:] = 0
+
+    def render_automated(self, outdata, block, sample_gains, volume):
+        """Like render(), but with per-sample gains (n, channels) or (n, C, channels), e.g. from a Trajectory."""
+        n = len(block)
+        target = outdata[:n]
+        if block.ndim == 1:
+            np.multiply(sample_gains[:n], block[:, np.newaxis], out=target)
+        else:
+            np.einsum('nc,nco->no', block, sample_gains[:n], out=target)
+        target *= volume
+        outdata[n:] = 0
+
+
+# ======================== Multi-source mixer ========================
+
+class MixSource:
+    """One positioned source: a reader with read(frames) -> (n,) or (n, C) view, plus its placement.
+
+    A reader with a `channels` attribute above 1 (a StreamingSource in
+    "split" mode, say) has each channel placed separately, spread over
+    `width` degrees around the azimuth as in the engine.
+    Changing azimuth/elevation/gain/width has no audible effect until SourceMixer.refresh().
+    A distance in metres (None for none) runs the source through its own
+    DistanceProcessor, created by refresh(); later changes apply on the next block,
+    and setting a larger one grows its delay line here, off the audio thread.
+    """
+
+    def __init__(self, reader, azimuth=0.0, gain=1.0, elevation=0.0, distance=None, width=60.0):
+        self.reader = reader
+        self.channels = getattr(reader, "channels", 1)
+        self.azimuth = azimuth
+        self.gain = gain
+        self.elevation = elevation  # only used by 3D layouts
+        self.processor = None
+        self.distance = distance
+        self.width = width
+
+    @property
+    def distance(self):
+        return self._distance
+
+    @distance.setter
+    def distance(self, metres):
+        self._distance = metres
+        if metres is not None and self.processor is not None:
+            self.processor.reserve(metres)
+
+
+@dataclass(frozen=True)
+class MixState:
+    """What the audio thread mixes: the sources and their (rows, channels) gain matrices, one row per source channel."""
+    sources: tuple
+    gains: np.ndarray
+    folded: np.ndarray
+    block: np.ndarray
+
+
+class SourceMixer:
+    """Mixes N positioned sources into the output with one matmul per block.
+
+    The GUI thread edits the source list and calls refresh(), which solves the
+    direction of every source channel in one batched VBAP call, folds in the
+    downmix (by default the ITU stereo fold-down of the layout, used when the
+    output has two channels) and swaps in a new MixState by reference.
+    The callback pulls each source's (frames, C) block into C rows of a
+    (rows, frames) scratch matrix and writes block.T @ gains straight into outdata.
+    """
+
+    def __init__(self, layout, downmix=None, max_frames=4096, samplerate=48000):
+        self.layout = layout
+        self.samplerate = samplerate
+        self.downmix = downmix or Downmix.itu_stereo(layout)
+        if self.downmix.n_inputs != layout.n_speakers:
+            raise ValueError(f"Downmix {self.downmix.name!r} does not take {layout.n_speakers} speakers")
+        self.max_frames = max_frames
+        self.sources = []
+        self._matrix = np.zeros((0, max(layout.n_speakers, self.downmix.n_outputs)), dtype=np.float32)
+        self.current = None
+        self.refresh()
+
+    def add(self, source):
+        self.sources.append(source)
+        self.refresh()
+        return source
+
+    def remove(self, source):
+        self.sources.remove(source)
+        self.refresh()
+
+    def refresh(self):
+        sources = tuple(self.sources)
+        for source in sources:
+            if source.distance is not None and source.processor is None:
+                source.processor = DistanceProcessor(self.samplerate, source.channels,
+                                                     max(200.0, source.distance + 1.0), self.max_frames)
+        azimuths, elevations, row_gains = [], [], []
+        for s in sources:
+            azimuths.extend(s.azimuth + spread_offsets(s.channels, s.width))
+            elevations.extend([s.elevation] * s.channels)
+            row_gains.extend([s.gain] * s.channels)
+        rows = len(azimuths)
+        if self.layout.dimensions == 3:
+            gains = self.layout.gains_for(azimuths, elevations)
+        else:
+            gains = self.layout.gains_for(azimuths)
+        gains = gains.reshape(rows, self.layout.n_speakers).astype(np.float32)
+        gains *= np.array(row_gains, dtype=np.float32)[:, np.newaxis]
+
+        # Reuse the scratch block while it is big enough, only the audio thread writes it
+        previous = self.current
+        if previous is not None and previous.block.shape[0] >= rows:
+            block = previous.block
+        else:
+            block = np.zeros((max(rows, 1), self.max_frames), dtype=np.float32)
+        if self._matrix.shape[0] < rows:
+            self._matrix = np.zeros((rows, self._matrix.shape[1]), dtype=np.float32)
+
+        folded = self.downmix.apply(gains)
+        self.current = MixState(sources, gains, folded, block)
+
+    def render(self, outdata, volume=1.0):
+        """Mix every source's next block into outdata (frames, channels)."""
+        state = self.current
+        if len(state.gains) == 0:
+            outdata.fill(0)
+            return
+        # Blocks above max_frames go through in slices, the scratch never grows here
+        for start in range(0, len(outdata), self.max_frames):
+            self._render(state, outdata[start:start + self.max_frames], volume)
+
+    def _render(self, state, outdata, volume):
+        frames, channels = outdata.shape
+        rows = len(state.gains)
+        block = state.block
+        row = 0
+        for source in state.sources:
+            chunk = source.reader.read(frames)
+            n, c = len(chunk), source.channels
+            lanes = block[row:row + c, :frames]
+            lanes[:, :n] = chunk.reshape(n, c).T
+            lanes[:, n:] = 0
+            if source.distance is not None and source.processor is not None:
+                # The whole block, so the delay line keeps running out after the reader ends
+                source.processor.process(lanes.T, source.distance, out=lanes.T)
+            row += c
+
+        gains = state.gains if channels == self.layout.n_speakers else state.folded
+        matrix = np.multiply(gains, volume, out=self._matrix[:rows, :channels])
+        np.matmul(block[:rows, :frames].T, matrix, out=outdata)
+
+
+# ======================== Output sample formats ========================
+
+OUTPUT_FORMATS = ("float32", "int16", "int24", "int32")
+
+
+class IntegerOutput:
+    """Converts rendered float32 blocks to a device's integer sample format.
+
+    Blocks are rendered into the float32 scratch from buffer(), then write()
+    scales them to full scale, adds TPDF dither of one LSB (int16/int24
+    only, int32 is finer than float32 resolves), rounds and clips in place
+    and stores the result into the stream's buffer. int24 streams are raw,
+    packed three bytes per sample, so they get the low bytes of an int32.
+    Nothing is allocated per block.
+    """
+
+    def __init__(self, sample_format, channels, max_frames=4096, dither=None, seed=None):
+        if sample_format not in OUTPUT_FORMATS[1:]:
+            raise ValueError(f"Unknown integer format {sample_format!r}, choose from {', '.join(OUTPUT_FORMATS[1:])}")
+        self.sample_format = sample_format
+        self.channels = channels
+        bits = int(sample_format[3:])
+        self.dither = bits < 32 if dither is None else dither
+        self._scale = np.float32(2 ** (bits - 1))
+        self._low = -self._scale
+        # The largest float32 that still fits: 2**31 - 1 itself rounds up to 2**31
+        self._high = min(np.float32(2 ** (bits - 1) - 1), np.nextafter(self._scale, np.float32(0)))
+        self._rng = np.random.default_rng(seed)
+        self._allocate(max_frames)
+
+    def _allocate(self, frames):
+        self._mix = np.zeros((frames, self.channels), dtype=np.float32)
+        self._noise = np.zeros((frames, self.channels), dtype=np.float32)
+        self._ints = np.zeros((frames, self.channels), dtype=np.int32)
+
+    def buffer(self, frames):
+        """float32 scratch (frames, channels) to render the next block into."""
+        if len(self._mix) < frames:
+            self._allocate(frames)
+        return self._mix[:frames]
+
+    def write(self, outdata, frames):
+        """Dither, clip and store the first `frames` rendered rows into outdata."""
+        mix = self._mix[:frames]
+        mix *= self._scale
+        if self.dither:
+            # Triangular (TPDF) dither: the difference of two uniform draws, ±1 LSB
+            noise = self._noise[:frames]
+            self._rng.random(out=noise, dtype=np.float32)
+            mix += noise
+            self._rng.random(out=noise, dtype=np.float32)
+            mix -= noise
+        np.rint(mix, out=mix)
+        np.clip(mix, self._low, self._high, out=mix)
+
+        if self.sample_format == "int24":
+            ints = self._ints[:frames]
+            np.copyto(ints, mix, casting='unsafe')
+            packed = np.frombuffer(outdata, dtype=np.uint8).reshape(frames, self.channels, 3)
+            low_bytes = slice(0, 3) if sys.byteorder == "little" else slice(1, 4)
+            packed[:] = ints.view(np.uint8).reshape(frames, self.channels, 4)[..., low_bytes]
+        else:
+            np.copyto(outdata, mix, casting='unsafe')
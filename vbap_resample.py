@@ -0,0 +1,166 @@
+from functools import lru_cache
+from math import gcd
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# ======================== Polyphase filter tables ========================
+
+@lru_cache(maxsize=16)
+def polyphase_table(up, down, taps=32, rolloff=0.94, beta=8.0):
+    """Kaiser-windowed sinc for resampling by up/down, split into `up` phases of `taps`.
+
+    Row p holds the weights of input samples i - taps/2 + 1 … i + taps/2 for
+    an output that lands p/up of the way past input sample i. Each row sums
+    to one. Cached per ratio, so switching between a few file rates costs
+    nothing after the first time.
+    """
+    half = taps // 2
+    cutoff = min(1.0, up / down) * rolloff
+    offsets = np.arange(-half + 1, half + 1)
+    n = np.arange(up)[:, np.newaxis] - offsets[np.newaxis, :] * up  # distance in 1/up input samples
+    window = np.i0(beta * np.sqrt(np.clip(1.0 - (n / (half * up)) ** 2, 0.0, None))) / np.i0(beta)
+    table = cutoff * np.sinc(cutoff * n / up) * window
+    table /= table.sum(axis=1, keepdims=True)
+    table = table.astype(np.float32)
+    table.flags.writeable = False
+    return table
+
+
+# ======================== Streaming resampler ========================
+
+class StreamingResampler:
+    """Wraps a StreamingSource so it reads at another sample rate.
+
+    Presents the same read/seek/position/channels interface, in frames of
+    the new rate. Each block gathers its input windows and applies the cached
+    polyphase rows in one vectorised pass, so the cost per output sample is
+    `taps` multiply-adds whatever the ratio. The input history and phase carry
+    over between calls; a jump in the source's block_start (a seek landing)
+    restarts them. A seek starts the source half a filter early, so the
+    first output is the target frame itself, computed from real input
+    exactly as if playback had run into it.
+    """
+
+    def __init__(self, source, samplerate, taps=32, max_frames=4096):
+        self.source = source
+        self.samplerate = samplerate
+        common = gcd(int(samplerate), int(source.samplerate))
+        self.up = int(samplerate) // common
+        self.down = int(source.samplerate) // common
+        self.taps = taps
+        self.table = polyphase_table(self.up, self.down, taps)
+        self.frames = -(-source.frames * self.up // self.down)
+        self.channels = getattr(source, "channels", 1)
+
+        self._buffer = np.zeros((max_frames * self.down // self.up + 4 * taps, self.channels), dtype=np.float32)
+        self._out = np.zeros((max_frames, self.channels), dtype=np.float32)
+        self._base = 0        # source frame held in _buffer[0]
+        self._count = 0       # valid samples in _buffer
+        self._next_out = 0    # output frame of the next sample read() returns
+        self._flushed = False
+        # Any thread: (source frame, output frame) of the latest seek
+        self._seek_target = (0, 0)
+        self._restart(0)
+        self.block_start = 0
+
+    @property
+    def position(self):
+        source_frame, frame = self._seek_target
+        position = self.source.position
+        if position == source_frame:
+            # Nothing played since the seek (or it has not landed yet)
+            return frame
+        return round(position * self.up / self.down)
+
+    @property
+    def finished(self):
+        if self._next_out >= self.frames:
+            return True
+        # After the flush, done once every output the buffered input reaches has been read
+        return self.source.finished and self._flushed and self._next_out >= self._buffered_end()
+
+    @property
+    def ready(self):
+        return getattr(self.source, "ready", True)
+
+    def seek(self, frame):
+        frame = min(max(int(frame), 0), self.frames)
+        source_frame = max(frame * self.down // self.up - (self.taps // 2 - 1), 0)
+        self._seek_target = (source_frame, frame)
+        self.source.seek(source_frame)
+
+    def close(self):
+        self.source.close()
+
+    def _restart(self, source_frame):
+        """Start over at source_frame, with silence before it as filter history."""
+        half = self.taps // 2
+        self._base = source_frame - (half - 1)
+        self._buffer[:half - 1] = 0
+        self._count = half - 1
+        target_source, target = self._seek_target
+        if target_source == source_frame:
+            # Landed where seek() aimed: the input before the target is filter history
+            self._next_out = target
+        else:
+            self._next_out = -(-source_frame * self.up // self.down)
+        self._flushed = False
+
+    def _buffered_end(self):
+        """Output frame just past the last one whose whole input window is buffered."""
+        return ((self._base + self._count - self.taps // 2) * self.up - 1) // self.down + 1
+
+    def _append(self, samples):
+        if self._count + len(samples) > len(self._buffer):
+            grown = np.zeros((self._count + len(samples) + self.taps, self.channels), dtype=np.float32)
+            grown[:self._count] = self._buffer[:self._count]
+            self._buffer = grown
+        self._buffer[self._count:self._count + len(samples)] = samples.reshape(len(samples), self.channels)
+        self._count += len(samples)
+
+    def read(self, frames):
+        """Return up to `frames` resampled samples as a view into a scratch buffer."""
+        half = self.taps // 2
+        for _ in range(2):
+            last = self._next_out + frames - 1
+            wanted = (last * self.down) // self.up + half + 1 - (self._base + self._count)
+            if wanted <= 0:
+                break
+            chunk = self.source.read(wanted)
+            if len(chunk) and self.source.block_start != self._base + self._count:
+                # A seek landed: restart there and top up from the new position
+                self._restart(self.source.block_start)
+                self._append(chunk)
+                continue
+            self._append(chunk)
+            if len(chunk) < wanted and self.source.finished and not self._flushed:
+                # Nothing more is coming: zeros let the last samples through the filter
+                self._append(np.zeros((self.taps, self.channels), dtype=np.float32))
+                self._flushed = True
+            break
+
+        # Outputs whose whole input window is buffered, capped at the end of the file
+        stop = min(last + 1, self._buffered_end(), self.frames)
+        n = max(stop - self._next_out, 0)
+        self.block_start = self._next_out
+        if len(self._out) < frames:
+            self._out = np.zeros((frames, self.channels), dtype=np.float32)
+        out = self._out[:n, 0] if self.channels == 1 else self._out[:n]
+        if n == 0:
+            return out
+
+        ticks = (self._next_out + np.arange(n)) * self.down
+        index = ticks // self.up - self._base - half + 1
+        windows = sliding_window_view(self._buffer[:self._count], self.taps, axis=0)  # (k, channels, taps)
+        np.einsum('kj,kcj->kc', self.table[ticks % self.up], windows[index], out=self._out[:n])
+        self._next_out += n
+
+        # Drop input no later output can reach
+        keep_from = (self._next_out * self.down) // self.up - self._base - half + 1
+        if keep_from > 0:
+            remaining = self._count - keep_from
+            self._buffer[:remaining] = self._buffer[keep_from:self._count]
+            self._base += keep_from
+            self._count = remaining
+        return out
@@ -0,0 +1,253 @@
+import threading
+
+import numpy as np
+import soundfile as sf
+
+# ======================== Streaming file source ========================
+
+# Landing pads for staged seeks: one being played, one staged, one free to fill
+LANDING_PADS = 3
+
+INPUT_MODES = ("mono", "first", "split")
+
+
+def input_matrix(file_channels, mode="mono"):
+    """(file_channels, channels) matrix applied to every block read from a file.
+
+    "mono" is an energy-preserving downmix (each channel at 1/sqrt(C)),
+    "first" keeps channel 0 only and "split" keeps every channel separately.
+    """
+    if mode == "mono":
+        return np.full((file_channels, 1), 1 / np.sqrt(file_channels), dtype=np.float32)
+    if mode == "first":
+        return np.eye(file_channels, 1, dtype=np.float32)
+    if mode == "split":
+        return np.eye(file_channels, dtype=np.float32)
+    raise ValueError(f"Unknown input mode {mode!r}, choose from {', '.join(INPUT_MODES)}")
+
+
+def spread_offsets(channels, width_deg):
+    """Azimuth offsets that spread `channels` split sources evenly over width_deg, left to right."""
+    if channels == 1:
+        return np.zeros(1)
+    return np.linspace(-width_deg / 2, width_deg / 2, channels)
+
+
+def spread_gains(gains_for, azimuths, offsets):
+    """Gains for every input channel around each azimuth: (N, len(offsets) * outputs).
+
+    gains_for maps (M,) azimuths to (M, outputs); all N * len(offsets)
+    directions go through it in one batch. Rows reshape to (len(offsets), outputs).
+    """
+    directions = np.asarray(azimuths, dtype=np.float64).reshape(-1, 1) + offsets
+    return np.asarray(gains_for(directions.reshape(-1))).reshape(len(directions), -1)
+
+
+class StreamingSource:
+    """Plays a sound file from disk through a bounded, prefetched ring buffer.
+
+    A background thread reads the file in blocks of `block_frames` with
+    soundfile.SoundFile, maps each block through input_matrix(input_mode) in
+    one matrix product and keeps up to `buffer_seconds` of the result ahead of
+    the playhead. read() returns (n,) samples when that is a single channel
+    and (n, channels) otherwise. The ring is indexed by absolute file frame, so the producer
+    only ever writes `_fill_*` and the audio thread only ever writes
+    `_play_pos`; neither side takes a lock.
+
+    Seeks are staged: seek() only queues the target frame. The prefetch
+    thread reads `start_blocks` blocks from there into a spare landing pad
+    and publishes it; read() keeps playing the old position until then and
+    switches to the pad on the next block, while the ring refills behind it.
+    Opening the file is a seek to frame 0, so read() returns silence until
+    that first pad is ready.
+    """
+
+    def __init__(self, path, buffer_seconds=10.0, block_frames=4096, start_blocks=4, input_mode="mono"):
+        self.path = path
+        self.file = sf.SoundFile(path)
+        self.samplerate = self.file.samplerate
+        self.frames = self.file.frames
+        self.input_mode = input_mode
+        self._matrix = input_matrix(self.file.channels, input_mode)
+        self.channels = self._matrix.shape[1]
+        self.block_frames = block_frames
+        self.prime_frames = start_blocks * block_frames
+
+        capacity = max(int(buffer_seconds * self.samplerate), (start_blocks + 2) * block_frames)
+        self._ring = np.zeros((capacity, self.channels), dtype=np.float32)
+        self._pads = np.zeros((LANDING_PADS, self.prime_frames, self.channels), dtype=np.float32)
+        self._block = np.zeros((block_frames, self.file.channels), dtype=np.float32)
+        self._mixed = np.zeros((block_frames, self.channels), dtype=np.float32)
+        self._stage_block = np.zeros((self.prime_frames, self.file.channels), dtype=np.float32)
+        self._out = np.zeros((block_frames, self.channels), dtype=np.float32)
+
+        # Producer-owned: the contiguous run of frames [_fill_start, _fill_pos) in the ring,
+        # the last staged seek as (serial, pad, frame, frames) and the seek the ring follows
+        self._fill_start = 0
+        self._fill_pos = 0
+        self._staged = (0, 0, 0, 0)
+        self._ring_serial = 0
+        # Consumer-owned: absolute playhead, priming flag and the landing pad being played
+        self._play_pos = 0
+        self._priming = False
+        self._applied_seek = 0
+        self._pad = 0
+        self._pad_start = 0
+        self._pad_end = 0
+        self.block_start = 0
+        # Any thread: latest (serial, frame) seek request
+        self._seek_request = (1, 0)
+
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._poll = block_frames / self.samplerate / 4
+        self._thread = threading.Thread(target=self._prefetch, name="prefetch", daemon=True)
+        self._thread.start()
+
+    # ---------------------- Control (GUI thread) ----------------------
+
+    @property
+    def position(self):
+        """Playhead in frames, or the target of a seek that has not landed yet."""
+        serial, frame = self._seek_request
+        return frame if serial != self._applied_seek else self._play_pos
+
+    @property
+    def finished(self):
+        return self.position >= self.frames
+
+    @property
+    def ready(self):
+        """True once the latest seek (or the opening one) is staged, so read() returns audio."""
+        return self._staged[0] == self._seek_request[0]
+
+    def seek(self, frame):
+        """Queue a seek to an absolute frame; it lands on the first block after staging."""
+        serial, _ = self._seek_request
+        self._seek_request = (serial + 1, min(max(int(frame), 0), self.frames))
+        self._wake.set()
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        self.file.close()
+
+    # ---------------------- Consumer (audio thread) ----------------------
+
+    def read(self, frames):
+        """Return up to `frames` samples as a view into a scratch buffer.
+
+        Fewer frames than asked means end of file, or an underrun while the
+        prefetch thread catches up (check `finished` to tell them apart).
+        `block_start` is set to the file frame of the first returned sample.
+        """
+        serial, _ = self._seek_request
+        if serial != self._applied_seek:
+            staged_serial, pad, start, count = self._staged
+            if staged_serial == serial:
+                self._pad = pad
+                self._pad_start = start
+                self._pad_end = start + count
+                self._play_pos = start
+                self._priming = False
+                self._applied_seek = serial
+
+        if len(self._out) < frames:
+            self._out = np.zeros((frames, self.channels), dtype=np.float32)
+
+        play = self._play_pos
+        self.block_start = play
+        n = 0
+        if self._pad_start <= play < self._pad_end:
+            n = min(frames, self._pad_end - play)
+            offset = play - self._pad_start
+            self._out[:n] = self._pads[self._pad, offset:offset + n]
+        n += self._read_ring(play + n, self._out[n:frames])
+        self._play_pos = play + n
+        return self._out[:n, 0] if self.channels == 1 else self._out[:n]
+
+    def _read_ring(self, play, out):
+        fill_pos = self._fill_pos
+        capacity = len(self._ring)
+        # Slots just behind the fill position may be being overwritten, keep a block of margin
+        lower = max(self._fill_start, fill_pos - capacity + self.block_frames)
+        available = fill_pos - play if lower <= play else 0
+
+        if self._priming:
+            if available < self.prime_frames and fill_pos < self.frames:
+                return 0
+            self._priming = False
+
+        n = max(min(available, len(out)), 0)
+        start = play % capacity
+        head = min(n, capacity - start)
+        out[:head] = self._ring[start:start + head]
+        out[head:n] = self._ring[:n - head]
+
+        if n < len(out) and play + n < self.frames:
+            self._priming = True
+        return n
+
+    # ---------------------- Producer (prefetch thread) ----------------------
+
+    def _stage(self, serial, frame):
+        """Read the first blocks at a seek target into a landing pad the consumer is not using."""
+        busy = (self._pad, self._staged[1])
+        pad = next(p for p in range(LANDING_PADS) if p not in busy)
+        self.file.seek(frame)
+        count = self.file.read(self.prime_frames, dtype='float32', always_2d=True, out=self._stage_block).shape[0]
+        np.matmul(self._stage_block[:count], self._matrix, out=self._pads[pad, :count])
+        self._staged = (serial, pad, frame, count)
+        self.file.seek(self._fill_pos)
+
+    def _restart(self, frame):
+        # Moving the start first keeps [_fill_start, _fill_pos) valid at every step for the reader
+        self._fill_start = frame
+        self._fill_pos = frame
+        self.file.seek(frame)
+
+    def _prefetch(self):
+        capacity = len(self._ring)
+        while not self._stop.is_set():
+            serial, frame = self._seek_request
+            if serial != self._staged[0]:
+                self._stage(serial, frame)
+                continue
+
+            staged_serial, _, start, count = self._staged
+            if self._applied_seek == staged_serial != self._ring_serial:
+                # The consumer switched to the staged pad: carry on filling right after it,
+                # unless the ring already holds that point (short seeks, and opening the file)
+                self._ring_serial = staged_serial
+                lower = max(self._fill_start, self._fill_pos - capacity + self.block_frames)
+                if not lower <= start + count <= self._fill_pos:
+                    self._restart(start + count)
+                continue
+
+            # Frames still coming from the landing pad need no ring space
+            play = max(self._play_pos, self._pad_end)
+            lower = max(self._fill_start, self._fill_pos - capacity + self.block_frames)
+            if play < lower or play > self._fill_pos:
+                # Playhead left the buffered run: restart filling from there
+                self._restart(play)
+                continue
+
+            # Stop a block short of full, so the reader's margin never excludes the playhead
+            if self._fill_pos >= self.frames or self._fill_pos + 2 * self.block_frames - play > capacity:
+                self._wake.wait(self._poll)
+                self._wake.clear()
+                continue
+
+            n = self.file.read(self.block_frames, dtype='float32', always_2d=True, out=self._block).shape[0]
+            if n == 0:
+                # Shorter than the header claimed, treat what we have as the end
+                self.frames = self._fill_pos
+                continue
+
+            mixed = np.matmul(self._block[:n], self._matrix, out=self._mixed[:n])
+            start = self._fill_pos % capacity
+            head = min(n, capacity - start)
+            self._ring[start:start + head] = mixed[:head]
+            self._ring[:n - head] = mixed[head:n]
+            self._fill_pos += n
@@ -0,0 +1,88 @@
+import csv
+
+import numpy as np
+
+# ======================== Azimuth automation ========================
+
+# Gains are solved every CONTROL_FRAMES samples of the file and interpolated
+# linearly in between. The grid is anchored at frame 0, so a render comes out
+# the same whatever block size the device or the offline renderer uses.
+CONTROL_FRAMES = 64
+
+
+class Trajectory:
+    """Time-stamped azimuth (and linear gain) keyframes for one source.
+
+    Between keyframes both are interpolated linearly. Azimuths are taken as
+    given, so 0 -> 720 is two full turns. With loop=True the keyframes repeat
+    every times[-1] - times[0] seconds.
+    """
+
+    def __init__(self, times, azimuths, gains=None, loop=False):
+        self.times = np.asarray(times, dtype=np.float64).reshape(-1)
+        self.azimuths = np.asarray(azimuths, dtype=np.float64).reshape(-1)
+        self.gains = np.ones_like(self.times) if gains is None else np.asarray(gains, dtype=np.float64).reshape(-1)
+        if len(self.times) == 0:
+            raise ValueError("A trajectory needs at least one keyframe")
+        if not len(self.times) == len(self.azimuths) == len(self.gains):
+            raise ValueError("Trajectory times, azimuths and gains differ in length")
+        if np.any(np.diff(self.times) < 0):
+            raise ValueError("Trajectory keyframe times must not decrease")
+        self.loop = loop and self.times[-1] > self.times[0]
+
+    @classmethod
+    def rotation(cls, speed_deg, start_deg=0.0, gain=1.0):
+        """Endless rotation at speed_deg degrees per second (negative turns the other way)."""
+        if speed_deg == 0:
+            return cls([0.0], [start_deg], [gain])
+        period = 360.0 / abs(speed_deg)
+        return cls([0.0, period], [start_deg, start_deg + np.copysign(360.0, speed_deg)],
+                   [gain, gain], loop=True)
+
+    def at(self, seconds):
+        """Return (azimuths, gains) at the given times in seconds."""
+        seconds = np.asarray(seconds, dtype=np.float64)
+        if self.loop:
+            start = self.times[0]
+            seconds = start + np.mod(seconds - start, self.times[-1] - start)
+        return np.interp(seconds, self.times, self.azimuths), np.interp(seconds, self.times, self.gains)
+
+    def sample_gains(self, gains_for, start_frame, frames, samplerate, control_frames=CONTROL_FRAMES):
+        """Per-sample channel gains (frames, channels) for file frames [start_frame, start_frame + frames).
+
+        gains_for maps an array of azimuths to their (N, channels) gains. It
+        is only called on the control points covering the block; the samples
+        in between are interpolated in one vectorised pass.
+        """
+        first = start_frame // control_frames
+        last = (start_frame + max(frames, 1) - 1) // control_frames + 1
+        points = np.arange(first, last + 1)
+        azimuths, levels = self.at(points * control_frames / samplerate)
+        control = np.asarray(gains_for(azimuths), dtype=np.float32) * levels[:, np.newaxis].astype(np.float32)
+
+        offset = np.arange(frames) + (start_frame - first * control_frames)
+        index = offset // control_frames
+        frac = (offset % control_frames).astype(np.float32) / np.float32(control_frames)
+        step = control[1:] - control[:-1]
+        return control[index] + step[index] * frac[:, np.newaxis]
+
+
+def load_trajectory(path):
+    """Read "time_seconds,azimuth_deg[,gain]" keyframes from a CSV file.
+
+    Header and blank lines are skipped. Azimuths are unwrapped so
+    interpolation takes the short way round instead of sweeping back through
+    180°; write explicit keyframes for longer moves.
+    """
+    keyframes = []
+    with open(path, newline='') as f:
+        for row in csv.reader(f):
+            try:
+                gain = float(row[2]) if len(row) > 2 and row[2].strip() else 1.0
+                keyframes.append((float(row[0]), float(row[1]), gain))
+            except (ValueError, IndexError):
+                continue
+    if not keyframes:
+        raise ValueError(f"No keyframes found in {path}")
+    keyframes = np.array(sorted(keyframes))
+    return Trajectory(keyframes[:, 0], np.unwrap(keyframes[:, 1], period=360), keyframes[:, 2])
@@ -0,0 +1,182 @@
+import math
+import tkinter as tk
+from time import perf_counter
+
+import numpy as np
+
+from vbap_metrics import format_metrics
+
+# ======================== Shared Tk widgets ========================
+
+class MetricsPanel(tk.Frame):
+    """Collapsible readout of an engine's CallbackMetrics, refreshed from the Tk loop."""
+
+    def __init__(self, parent, metrics, interval_ms=500, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.metrics = metrics
+        self.interval_ms = interval_ms
+        self.visible = tk.BooleanVar(value=False)
+
+        tk.Checkbutton(self, text="Show audio metrics", variable=self.visible, command=self.toggle,
+                       font=("Arial", 12), cursor="hand2").pack(anchor="w")
+        self.label = tk.Label(self, font=("Courier", 11), justify=tk.LEFT, anchor="w")
+        self.refresh()
+
+    def toggle(self):
+        if self.visible.get():
+            self.label.pack(anchor="w")
+        else:
+            self.label.pack_forget()
+
+    def refresh(self):
+        if self.visible.get():
+            self.label.config(text=format_metrics(self.metrics.snapshot()))
+        self.after(self.interval_ms, self.refresh)
+
+
+class CircularSlider(tk.Canvas):
+    """Azimuth dial: drag the red pointer round the circle, 0° at the top, clockwise.
+
+    The circle and markers are drawn once; a drag only moves the pointer
+    line. Motion events just record the latest angle. The pointer is redrawn
+    at most once per `frame_ms` and `command(angle)` runs at most once per
+    `min_interval()` seconds (e.g. an audio block), always with the latest
+    angle, so a fast drag never queues up redraws or gain solves.
+    `on_release(angle)` runs once the button is let go.
+    """
+
+    def __init__(self, parent, radius=140, padding=70, command=None, on_release=None, min_interval=None,
+                 frame_ms=16, speakers=(0, 30, 110, 250, 330), **kwargs):
+        self.radius = radius
+        self.padding = padding
+        total_size = 2 * radius + padding
+
+        kwargs.pop('width', None)
+        kwargs.pop('height', None)
+
+        super().__init__(parent, width=total_size, height=total_size, **kwargs)
+
+        self.center = (radius + padding // 2, radius + padding // 2)
+        self.angle = 0
+        self.command = command
+        self.release_command = on_release
+        self.min_interval = min_interval or (lambda: 0.0)
+        self.frame_ms = frame_ms
+        self._redraw_job = None
+        self._command_job = None
+        self._sent_angle = None
+        self._sent_at = 0.0
+
+        self._draw_static(speakers)
+        self.pointer = self.create_line(*self.center, *self._point(self.angle, self.radius), width=3, fill="red")
+
+        self.bind("<Enter>", self.on_enter)
+        self.bind("<Leave>", self.on_leave)
+        self.bind("<B1-Motion>", self.on_drag)
+        self.bind("<ButtonRelease-1>", self.on_release)
+
+    def _point(self, deg, distance):
+        rad = math.radians(deg - 90)
+        return self.center[0] + distance * math.cos(rad), self.center[1] + distance * math.sin(rad)
+
+    def _draw_static(self, speakers):
+        x, y = self.center
+        self.create_oval(x - self.radius, y - self.radius, x + self.radius, y + self.radius, outline="black", width=3)
+
+        # Degree markers
+        for deg in [90, 180, 270]:
+            self.create_text(*self._point(deg, self.radius + 15), text=str(deg) + "°", font=("Arial", 14))
+
+        # Speaker markers
+        for deg in speakers:
+            self.create_text(*self._point(deg, self.radius + 15), text="🔊" + str(deg) + "°", fill='blue', font=("Arial", 14))
+
+    def _angle_at(self, event):
+        dx = event.x - self.center[0]
+        dy = event.y - self.center[1]
+        return (math.degrees(math.atan2(dy, dx)) + 90) % 360
+
+    def set_angle(self, angle):
+        """Move the pointer without calling command."""
+        self.angle = angle
+        self.coords(self.pointer, *self.center, *self._point(angle, self.radius))
+
+    def on_enter(self, event):
+        self.config(cursor="hand2")
+
+    def on_leave(self, event):
+        self.config(cursor="")
+
+    def on_drag(self, event):
+        self.angle = self._angle_at(event)
+        if self._redraw_job is None:
+            self._redraw_job = self.after(self.frame_ms, self._redraw)
+        if self._command_job is None and self.command is not None:
+            wait = self._sent_at + self.min_interval() - perf_counter()
+            self._command_job = self.after(max(self.frame_ms, int(wait * 1000) + 1), self._send)
+
+    def on_release(self, event):
+        self.angle = self._angle_at(event)
+        for job in (self._redraw_job, self._command_job):
+            if job is not None:
+                self.after_cancel(job)
+        self._redraw_job = self._command_job = None
+        self._redraw()
+        if self.release_command is not None:
+            self.release_command(self.angle)
+        elif self.command is not None:
+            self._send()
+
+    def _redraw(self):
+        self._redraw_job = None
+        self.set_angle(self.angle)
+
+    def _send(self):
+        self._command_job = None
+        if self.angle != self._sent_angle:
+            self._sent_angle = self.angle
+            self._sent_at = perf_counter()
+            self.command(self.angle)
+
+
+class WaveformOverview(tk.Canvas):
+    """Per-second RMS envelope of the loaded file, drawn once, with a playhead line.
+
+    set_envelope() draws one bar per pixel column (the loudest second it
+    covers) when a file is loaded; set_position() only moves the playhead.
+    Clicking calls command(fraction) with the clicked point as a fraction
+    of the file, e.g. to seek there.
+    """
+
+    def __init__(self, parent, width=500, height=40, floor_db=-60.0, command=None, **kwargs):
+        super().__init__(parent, width=width, height=height, highlightthickness=0, **kwargs)
+        self.overview_width = width
+        self.overview_height = height
+        self.floor_db = floor_db
+        self.command = command
+        self.playhead = self.create_line(0, 0, 0, height, fill="red", width=2)
+        self.bind("<Button-1>", self.on_click)
+
+    def set_envelope(self, rms_db):
+        self.delete("bar")
+        levels = np.asarray(rms_db, dtype=np.float64)
+        if len(levels) == 0:
+            return
+        columns = min(self.overview_width, len(levels))
+        starts = (np.arange(columns) * len(levels)) // columns
+        peaks = np.maximum.reduceat(np.maximum(levels, self.floor_db), starts)
+        heights = (peaks - self.floor_db) / -self.floor_db * self.overview_height
+        bar = self.overview_width / columns
+        middle = self.overview_height / 2
+        for i, h in enumerate(heights):
+            x = (i + 0.5) * bar
+            self.create_line(x, middle - h / 2, x, middle + h / 2, fill="steelblue", width=max(bar - 1, 1), tags="bar")
+        self.tag_raise(self.playhead)
+
+    def set_position(self, fraction):
+        x = min(max(fraction, 0.0), 1.0) * self.overview_width
+        self.coords(self.playhead, x, 0, x, self.overview_height)
+
+    def on_click(self, event):
+        if self.command is not None:
+            self.command(min(max(event.x / self.overview_width, 0.0), 1.0))